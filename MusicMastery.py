@@ -36,6 +36,8 @@ collab_txt = 'Below you will find a list of artists that have collaborated with
               by clicking on the headers.'
 # Establish a default error message in case of network disconnects
 error_txt = 'An error occurred. Please check your internet connection and try again.'
+# Separate message for when the Spotify API keeps rate limiting the requests
+rate_limit_txt = 'The Spotify API is receiving too many requests right now. Please wait a few minutes and try again.'
 
 
 
@@ -91,10 +93,11 @@ if input_artist:
         # Generate the training and test data
         X_train, y_train, X_test, y_test = prep_data_streamlit(artist_library_df, reclist_df)
 
-        # Set up and fit the model
+        # Set up and fit the model (or load it from the model registry, if it was already
+        # fit on the same recommended tracks), along with its feature importances
         RFC = RandomForestClassifier(class_weight='balanced_subsample', n_estimators=100, max_depth=2, random_state=0)
-        clf, cols2scale, cols2drop = build_pipeline(RFC)
-        clf.fit(X_train, y_train)
+        artifacts = fit_streamlit_model(X_train, y_train, RFC)
+        clf = artifacts['pipeline']
 
         # Generate suggested songs to promote based on y_pred
         y_pred = clf.predict(X_test)
@@ -112,19 +115,8 @@ if input_artist:
         st.subheader('**Audio Features Driving Popularity:**')
         st.markdown(feature_txt)
 
-        # Pull out the model components
-        col_trans = clf['preprocess']
-        forest = clf['model']
-        # Generate the feature names
-        new_cols = [c for c in X_train.columns if c not in cols2scale+cols2drop]
-        new_cols = cols2scale + new_cols
-        col_labels = [x.replace('Track_', '') for x in new_cols]
-
-        # Preprocess X_train for calculating feature importance
-        X_trans = col_trans.fit_transform(X_train)
-        X_trans = pd.DataFrame({k:X_trans[:,n] for n, k in enumerate(col_labels)})
-        # Calculate and plot the Random Forest feature importances
-        sorted_mean, sorted_std, sorted_labels, sorted_colors = get_RFC_importances(forest, X_trans, y_train, col_labels)
+        # Plot the Random Forest feature importances
+        sorted_mean, sorted_std, sorted_labels, sorted_colors = artifacts['importances']
         importances = plot_RFC_importances(sorted_mean, sorted_std, sorted_labels, sorted_colors, True)
 
         # Re-index the dataframe so it starts at 1 for better readability
@@ -151,6 +143,10 @@ if input_artist:
 
 
 
+    except RateLimitError:
+        # Return a rate limit message if the API kept rejecting requests
+        loading_msg.text('')
+        st.error(rate_limit_txt)
     except:
         # Return an error message if something goes wrong
         loading_msg.text('')
@@ -0,0 +1,140 @@
+"""Functions used for caching Spotify API responses on disk between runs."""
+
+
+# Import libraries
+import json
+import sqlite3
+import threading
+import time
+
+
+# Default location of the on-disk response cache
+CACHE_PATH = 'Data/api_cache.sqlite'
+
+# How long (in seconds) each type of entity stays fresh in the cache
+DAY = 24 * 60 * 60
+CACHE_TTL = {'artists': 7 * DAY,
+             'albums': 30 * DAY,
+             'album_tracks': 30 * DAY,
+             'tracks': 7 * DAY,
+             'audio_features': 365 * DAY,
+             'related_artists': 7 * DAY}
+
+# Maximum number of cached responses before the least recently used are evicted
+MAX_ENTRIES = 250000
+
+# The process-wide cache, opened on first use or replaced with set_cache()
+_cache = None
+_cache_enabled = True
+_cache_lock = threading.Lock()
+
+
+
+class ResponseCache:
+    """SQLite-backed cache of API objects keyed by endpoint and Spotify ID.
+
+    path - the location of the SQLite database file
+    ttl - dictionary of time-to-live values (in seconds) for each endpoint, defaults to CACHE_TTL
+    max_entries - the size cap, beyond which the least recently used entries are evicted
+    """
+    def __init__(self, path=CACHE_PATH, ttl=None, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.ttl = dict(CACHE_TTL)
+        if ttl:
+            self.ttl.update(ttl)
+        self.max_entries = max_entries
+        self.hits = {}
+        self.misses = {}
+
+        # A single connection is shared between threads, so guard it with a lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('CREATE TABLE IF NOT EXISTS responses ('
+                               'endpoint TEXT, key TEXT, value TEXT, created REAL, accessed REAL, '
+                               'PRIMARY KEY (endpoint, key))')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+
+    def get_many(self, endpoint, keys):
+        """Return a dictionary of the fresh cached objects for a list of keys (misses are left out)."""
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        oldest = now - self.ttl.get(endpoint, DAY)
+        found = {}
+        with self._lock, self._conn:
+            # Look the keys up in batches to stay under SQLite's variable limit
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i+500]
+                rows = self._conn.execute('SELECT key, value FROM responses '
+                                          'WHERE endpoint = ? AND created >= ? AND key IN ({})'.format(','.join('?' * len(batch))),
+                                          [endpoint, oldest] + batch).fetchall()
+                for key, value in rows:
+                    found[key] = json.loads(value)
+
+            # Mark the hits as recently used for the LRU eviction
+            self._conn.executemany('UPDATE responses SET accessed = ? WHERE endpoint = ? AND key = ?',
+                                   [(now, endpoint, k) for k in found])
+
+            # Keep track of the hit/miss counts for each endpoint
+            self.hits[endpoint] = self.hits.get(endpoint, 0) + len(found)
+            self.misses[endpoint] = self.misses.get(endpoint, 0) + len(keys) - len(found)
+        return found
+
+    def put_many(self, endpoint, items):
+        """Store a dictionary of objects (keyed by Spotify ID) under an endpoint."""
+        now = time.time()
+        rows = [(endpoint, k, json.dumps(v), now, now) for k, v in items.items()]
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)', rows)
+            self._evict()
+
+    def _evict(self):
+        """Drop the least recently used entries beyond the size cap (lock must be held)."""
+        count = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        if count > self.max_entries:
+            self._conn.execute('DELETE FROM responses WHERE rowid IN '
+                               '(SELECT rowid FROM responses ORDER BY accessed LIMIT ?)',
+                               (count - self.max_entries,))
+
+    def invalidate(self, endpoint, keys):
+        """Remove specific entries from the cache."""
+        with self._lock, self._conn:
+            self._conn.executemany('DELETE FROM responses WHERE endpoint = ? AND key = ?',
+                                   [(endpoint, k) for k in keys])
+
+    def clear(self):
+        """Remove every entry from the cache and reset the counters."""
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM responses')
+        self.hits = {}
+        self.misses = {}
+
+    def stats(self):
+        """Return the hit and miss counts for each endpoint as a dictionary."""
+        endpoints = sorted(set(self.hits).union(self.misses))
+        return {e:{'hits':self.hits.get(e, 0), 'misses':self.misses.get(e, 0)} for e in endpoints}
+
+
+
+def get_cache():
+    """Return the process-wide response cache, opening it on first use (None if disabled)."""
+    global _cache
+    if not _cache_enabled:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
+
+
+
+def set_cache(cache):
+    """Replace the response cache used by spotify_tools.
+
+    cache - a ResponseCache object, or None to turn caching off
+    """
+    global _cache, _cache_enabled
+    with _cache_lock:
+        _cache = cache
+        _cache_enabled = cache is not None
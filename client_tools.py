@@ -0,0 +1,271 @@
+"""Functions used for managing the shared connection to the Spotify API."""
+
+
+# Set up Spotipy (Spotify API package)
+import os
+import time
+import threading
+import requests
+import urllib3
+import spotipy
+from spotipy.oauth2 import SpotifyClientCredentials
+from spotipy.exceptions import SpotifyException
+from spotify_credentials import *
+os.environ["SPOTIPY_CLIENT_ID"] = client_id
+os.environ["SPOTIPY_CLIENT_SECRET"] = client_secret
+
+
+# Number of keep-alive connections held open to the API
+POOL_SIZE = 16
+
+# Status codes retried by the HTTP adapter (rate limits, 429, are left to the RequestScheduler)
+RETRY_CODES = (500, 502, 503, 504)
+
+# Request scheduling defaults: sustained requests per second, burst size, and concurrency bounds
+RATE_LIMIT = 20
+BURST_SIZE = 20
+MAX_CONCURRENCY = 16
+MIN_CONCURRENCY = 1
+# Number of times a rate-limited request is retried before giving up
+MAX_RETRIES = 6
+
+# The process-wide client, built on first use or injected with set_client()
+_client = None
+_client_lock = threading.Lock()
+
+# The process-wide request scheduler, built on first use or replaced with set_scheduler()
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+
+class RateLimitError(Exception):
+    """Raised when the API keeps rate limiting a request after every retry."""
+    def __init__(self, msg, retry_after=None):
+        super().__init__(msg)
+        self.retry_after = retry_after
+
+
+
+class RequestScheduler:
+    """Central scheduler that every API request goes through to stay under the rate limit.
+
+    Requests draw from a token bucket (rate per second, up to burst at once), and the number
+    of requests in flight is capped by a limit that adapts on its own: it grows by one after
+    a full window of successful requests and is halved on every 429 response. A 429 pauses
+    all requests until its Retry-After time has passed, so workers don't retry in a storm.
+
+    rate - the sustained number of requests per second
+    burst - the maximum number of requests that can be sent at once after an idle period
+    max_concurrency - the upper bound on requests in flight
+    min_concurrency - the lower bound on requests in flight
+    max_retries - the number of times a rate-limited request is retried
+    """
+    def __init__(self, rate=RATE_LIMIT, burst=BURST_SIZE, max_concurrency=MAX_CONCURRENCY,
+                 min_concurrency=MIN_CONCURRENCY, max_retries=MAX_RETRIES):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+
+        # Adaptive state, all guarded by the condition's lock
+        self.concurrency = max_concurrency
+        self.in_flight = 0
+        self.tokens = burst
+        self.last_refill = time.monotonic()
+        self.paused_until = 0
+        self.successes = 0
+        self.rate_limited = 0
+        self._cond = threading.Condition()
+
+    def _acquire(self):
+        """Wait for a concurrency slot, a token, and the end of any rate-limit pause."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                # Refill the token bucket for the time that has passed
+                self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+
+                # Work out how long to wait, if at all
+                if now < self.paused_until:
+                    delay = self.paused_until - now
+                elif self.in_flight >= int(self.concurrency):
+                    delay = None # until a request finishes
+                elif self.tokens < 1:
+                    delay = (1 - self.tokens) / self.rate
+                else:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    return
+                self._cond.wait(delay)
+
+    def _release(self, retry_after=None):
+        """Free a concurrency slot and adapt the limits to the outcome of the request."""
+        with self._cond:
+            self.in_flight -= 1
+            if retry_after is None:
+                # Additive increase after a full window of successful requests
+                self.successes += 1
+                if self.successes >= self.concurrency:
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+                    self.successes = 0
+            else:
+                # Multiplicative decrease, and pause everyone until the server allows requests again
+                self.rate_limited += 1
+                self.successes = 0
+                self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+                self.tokens = 0
+            self._cond.notify_all()
+
+    def call(self, func, *args, **kwargs):
+        """Run an API request through the scheduler, retrying it when it is rate limited."""
+        for attempt in range(self.max_retries + 1):
+            self._acquire()
+            try:
+                result = func(*args, **kwargs)
+            except SpotifyException as e:
+                if not is_rate_limit(e):
+                    self._release()
+                    raise
+                # Read the Retry-After header (in seconds)
+                retry_after = retry_after_seconds(e.headers, 2 ** attempt)
+                self._release(retry_after)
+                continue
+            except:
+                self._release()
+                raise
+            self._release()
+            return result
+        raise RateLimitError('Spotify API rate limit exceeded after {} retries'.format(self.max_retries),
+                             retry_after)
+
+
+
+class ScheduledClient:
+    """Wrapper around a Spotify client that sends every method call through a RequestScheduler."""
+    def __init__(self, client, scheduler):
+        self.client = client
+        self.scheduler = scheduler
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr):
+            return attr
+        def scheduled(*args, **kwargs):
+            return self.scheduler.call(attr, *args, **kwargs)
+        return scheduled
+
+
+
+def is_rate_limit(e):
+    """Check whether a SpotifyException is a rate limit response.
+
+    Only a 429 that carries a Retry-After header counts: when the HTTP adapter runs out of retries
+    on server errors (RETRY_CODES), spotipy also reports a 429, but without any headers.
+    """
+    return e.http_status == 429 and bool(e.headers) and 'Retry-After' in e.headers
+
+
+
+def retry_after_seconds(headers, default):
+    """Read the Retry-After header of a 429 response in seconds, falling back to a default."""
+    try:
+        return max(0, float(headers.get('Retry-After', default)))
+    except (AttributeError, TypeError, ValueError):
+        return default
+
+
+
+class SharedClientCredentials(SpotifyClientCredentials):
+    """Client credentials manager whose token can be shared safely between threads.
+
+    The token is cached and only refreshed once it expires, and only one thread
+    at a time is allowed to request a new one.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._token_lock = threading.Lock()
+
+    def get_access_token(self, *args, **kwargs):
+        with self._token_lock:
+            return super().get_access_token(*args, **kwargs)
+
+
+
+def pooled_session(pool_size=POOL_SIZE):
+    """Create a requests session that keeps a pool of connections to the API alive."""
+    # Use the same retry behaviour spotipy sets up for its own sessions
+    # (except for Retry-After responses, which are handled by the RequestScheduler)
+    retry = urllib3.Retry(total=3,
+                          connect=None,
+                          read=False,
+                          status=3,
+                          backoff_factor=0.3,
+                          status_forcelist=RETRY_CODES,
+                          respect_retry_after_header=False)
+
+    # Mount an adapter large enough to serve every worker thread at once
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                                            pool_maxsize=pool_size,
+                                            max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+
+def new_client(pool_size=POOL_SIZE):
+    """Build a Spotify client with a single self-refreshing token and a pooled HTTP session."""
+    # Token requests and API requests both go through the same pooled session
+    session = pooled_session(pool_size)
+    credentials = SharedClientCredentials(requests_session=session)
+    return spotipy.Spotify(client_credentials_manager=credentials,
+                           requests_session=session)
+
+
+
+def get_client():
+    """Return the process-wide Spotify client (routed through the request scheduler), creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = new_client()
+    return ScheduledClient(_client, get_scheduler())
+
+
+
+def set_client(client):
+    """Inject the client used by every function in spotify_tools (e.g. a stand-in for testing).
+
+    client - a spotipy.Spotify object (or anything with the same methods), or None to reset
+    """
+    global _client
+    with _client_lock:
+        _client = client
+
+
+
+def get_scheduler():
+    """Return the process-wide request scheduler, creating it on first use."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = RequestScheduler()
+    return _scheduler
+
+
+
+def set_scheduler(scheduler):
+    """Replace the request scheduler used by every API call.
+
+    scheduler - a RequestScheduler object, or None to reset it to the defaults
+    """
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = scheduler
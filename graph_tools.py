@@ -0,0 +1,300 @@
+"""Functions used for storing the related artists network between runs as a compact graph."""
+
+
+# Import libraries
+import os
+import json
+import time
+import threading
+import numpy as np
+from store_tools import file_lock
+
+
+# Default location of the saved artist graph
+GRAPH_PATH = 'Data/artist_graph.npz'
+
+# How long (in seconds) an artist's related artists are used before they are crawled again
+GRAPH_TTL = 7 * 24 * 60 * 60
+
+# The fields of the artist objects kept for each node (the rest of the API payload is dropped)
+ARTIST_INFO_KEYS = ['id', 'name', 'genres', 'popularity', 'followers']
+
+# The process-wide graph, loaded on first use or replaced with set_graph()
+_graph = None
+_graph_enabled = True
+_graph_lock = threading.Lock()
+
+
+
+class ArtistGraph:
+    """Persistent graph of related artists, held as a CSR (compressed sparse row) adjacency.
+
+    Artist ids are interned to node numbers, and the related artists of node i are
+    indices[indptr[i]:indptr[i+1]]. Each node records when it was last crawled (0 if it has
+    only been seen as someone's related artist), so only stale or missing nodes need to be
+    requested from the API. Nodes crawled since loading are kept in a small overlay that is
+    merged into the CSR arrays when the graph is saved. Saving merges in whatever other processes
+    have saved since (keeping the most recent crawl of each node), so several processes can share
+    a graph; the compressed file is written without holding the lock file, which is only taken to
+    check that nobody else saved in the meantime and swap the new file in.
+
+    path - the location of the .npz file the graph is saved to
+    ttl - the age (in seconds) beyond which a node's related artists are crawled again
+    """
+    def __init__(self, path=GRAPH_PATH, ttl=GRAPH_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.ids = []
+        self.index = {}
+        self.info = []
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.crawled = np.zeros(0, dtype=np.float64)
+        self._overlay = {}
+        self._dirty = False
+        self._stamp = None
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+        # Load the saved graph
+        if os.path.exists(path):
+            self._stamp = file_stamp(path)
+            with np.load(path) as npz:
+                self.ids = npz['ids'].tolist()
+                self.indptr = npz['indptr']
+                self.indices = npz['indices']
+                self.crawled = npz['crawled']
+                self.info = json.loads(str(npz['info']))
+            self.index = {x:i for i, x in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _intern(self, artist_id):
+        """Return the node number of an artist id, adding a node if it's new (lock must be held).
+
+        The crawl times of new nodes are only added by _grow(), once a batch of ids has been interned.
+        """
+        node = self.index.get(artist_id)
+        if node is None:
+            node = len(self.ids)
+            self.index[artist_id] = node
+            self.ids.append(artist_id)
+            self.info.append(None)
+        return node
+
+    def _grow(self):
+        """Extend the crawl times to cover the nodes added since the last call (lock must be held)."""
+        if len(self.crawled) < len(self.ids):
+            self.crawled = np.concatenate([self.crawled, np.zeros(len(self.ids) - len(self.crawled))])
+
+    def _neighbors(self, node):
+        """Return the node numbers of a node's related artists (lock must be held)."""
+        if node in self._overlay:
+            return self._overlay[node]
+        if node + 1 < len(self.indptr):
+            return self.indices[self.indptr[node]:self.indptr[node+1]]
+        return self.indices[:0]
+
+    def stale(self, artist_ids):
+        """Return the artist ids that have never been crawled, or not within the ttl."""
+        oldest = time.time() - self.ttl
+        with self._lock:
+            return [x for x in artist_ids if x not in self.index or self.crawled[self.index[x]] < oldest]
+
+    def update(self, related, crawled=None):
+        """Record the related artists of crawled artists.
+
+        related - a dictionary of lists of related artist objects (from the API), keyed by artist id
+        crawled - when the artists were crawled (now by default)
+        """
+        crawled = time.time() if crawled is None else crawled
+        with self._lock:
+            nodes = []
+            for artist_id, related_artists in related.items():
+                node = self._intern(artist_id)
+                neighbors = []
+                for art in related_artists:
+                    n = self._intern(art['id'])
+                    self.info[n] = {k:art[k] for k in ARTIST_INFO_KEYS if k in art}
+                    neighbors.append(n)
+                self._overlay[node] = np.array(neighbors, dtype=np.int32)
+                nodes.append(node)
+            self._grow()
+            self.crawled[nodes] = crawled
+            self._dirty = True
+
+    def related(self, artist_id):
+        """Return the ids of an artist's related artists (an empty list if it hasn't been crawled)."""
+        with self._lock:
+            node = self.index.get(artist_id)
+            if node is None:
+                return []
+            return [self.ids[n] for n in self._neighbors(node)]
+
+    def neighborhood(self, artist_id, degrees):
+        """Return the ids of every artist within a number of degrees of an artist (including it), from the graph alone."""
+        with self._lock:
+            if artist_id not in self.index:
+                return [artist_id]
+            seen = np.zeros(len(self.ids), dtype=bool)
+            frontier = np.array([self.index[artist_id]])
+            seen[frontier] = True
+            for _ in range(degrees):
+                if not len(frontier):
+                    break
+                nodes = np.concatenate([self._neighbors(n) for n in frontier])
+                frontier = np.unique(nodes[~seen[nodes]])
+                seen[frontier] = True
+            return [self.ids[n] for n in np.flatnonzero(seen)]
+
+    def artist_info(self, artist_ids):
+        """Return a dictionary of the stored artist objects (id, name, genres, popularity, followers) for a list of ids."""
+        with self._lock:
+            info = {}
+            for x in artist_ids:
+                node = self.index.get(x)
+                if node is not None and self.info[node] is not None:
+                    info[x] = self.info[node]
+            return info
+
+    def compact(self):
+        """Merge the nodes crawled since loading into the CSR arrays."""
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        """Merge the overlay into the CSR arrays (lock must be held).
+
+        Only the overlay's rows are gathered; the unchanged rows are moved to their new offsets in one go.
+        """
+        if not self._overlay:
+            return
+        n_old = len(self.indptr) - 1
+        old_lengths = np.diff(self.indptr)
+        changed = np.fromiter(self._overlay.keys(), dtype=np.int64, count=len(self._overlay))
+        rows = list(self._overlay.values())
+        row_lengths = np.array([len(r) for r in rows], dtype=np.int64)
+
+        # Row lengths and offsets of the new arrays
+        lengths = np.zeros(len(self.ids), dtype=np.int64)
+        lengths[:n_old] = old_lengths
+        lengths[changed] = row_lengths
+        indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        indices = np.empty(indptr[-1], dtype=np.int32)
+
+        # Shift the entries of the unchanged rows by how far their rows moved
+        keep = np.ones(n_old, dtype=bool)
+        keep[changed[changed < n_old]] = False
+        keep = np.repeat(keep, old_lengths)
+        shift = np.repeat(indptr[:n_old] - self.indptr[:-1], old_lengths)
+        indices[(np.arange(len(self.indices)) + shift)[keep]] = self.indices[keep]
+
+        # Place the overlay's rows
+        starts = np.cumsum(row_lengths) - row_lengths
+        shift = np.repeat(indptr[changed] - starts, row_lengths)
+        indices[np.arange(row_lengths.sum()) + shift] = np.concatenate(rows)
+
+        self.indptr = indptr
+        self.indices = indices
+        self._overlay = {}
+
+    def merge(self, path):
+        """Merge in another saved graph (e.g. a shard's), keeping whichever crawl of each node is more recent."""
+        with self._lock:
+            self._merge_saved(path)
+            self._dirty = True
+
+    def _merge_saved(self, path=None):
+        """Merge in a saved graph (this graph's file by default), keeping whichever crawl of each node is more recent (lock must be held)."""
+        path = self.path if path is None else path
+        if not os.path.exists(path):
+            return
+        if path == self.path:
+            self._stamp = file_stamp(path)
+        with np.load(path) as npz:
+            ids = npz['ids'].tolist()
+            indptr = npz['indptr']
+            indices = npz['indices']
+            crawled = npz['crawled']
+            info = json.loads(str(npz['info']))
+
+        # Map the saved nodes to this graph's nodes (adding any it doesn't have yet)
+        node_map = np.array([self._intern(x) for x in ids], dtype=np.int64)
+        self._grow()
+        for i in np.flatnonzero(crawled > self.crawled[node_map]):
+            self._overlay[node_map[i]] = node_map[indices[indptr[i]:indptr[i+1]]].astype(np.int32)
+            self.crawled[node_map[i]] = crawled[i]
+        for i, node in enumerate(node_map):
+            if self.info[node] is None:
+                self.info[node] = info[i]
+
+    def save(self):
+        """Save the graph, if anything was crawled or merged in since it was loaded or last saved.
+
+        The graph is compressed into a temporary file first (so an interrupted save never leaves a
+        partial file). The lock file next to the graph is then only held to check whether another
+        process saved in the meantime and, if not, swap the new file in; otherwise the other save is
+        merged in (keeping the most recent crawl of each node) and the file is written again.
+        """
+        with self._save_lock:
+            tmp_path = '{}.{}.tmp.npz'.format(self.path, os.getpid())
+            while True:
+                with self._lock:
+                    if self._stamp != file_stamp(self.path):
+                        self._merge_saved()
+                    if not self._dirty:
+                        return
+                    self._compact()
+                    arrays = {'ids':np.array(self.ids, dtype=str),
+                              'indptr':self.indptr,
+                              'indices':self.indices,
+                              'crawled':self.crawled.copy(),
+                              'info':np.array(json.dumps(self.info))}
+                    stamp = self._stamp
+                    self._dirty = False
+                np.savez_compressed(tmp_path, **arrays)
+                with file_lock(self.path + '.lock'):
+                    if file_stamp(self.path) == stamp:
+                        os.replace(tmp_path, self.path)
+                        with self._lock:
+                            self._stamp = file_stamp(self.path)
+                        return
+                # Another process saved first, so merge its graph in and write again
+                with self._lock:
+                    self._dirty = True
+
+
+
+def file_stamp(path):
+    """Return the inode, modification time, and size of a file, to tell whether it was replaced (None if it doesn't exist)."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+
+def get_graph():
+    """Return the process-wide artist graph, loading it on first use (None if disabled)."""
+    global _graph
+    if not _graph_enabled:
+        return None
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                _graph = ArtistGraph()
+    return _graph
+
+
+
+def set_graph(graph):
+    """Replace the artist graph used by spotify_tools.
+
+    graph - an ArtistGraph object, or None to turn the graph off
+    """
+    global _graph, _graph_enabled
+    with _graph_lock:
+        _graph = graph
+        _graph_enabled = graph is not None
@@ -3,21 +3,60 @@
 
 # Import libraries and functions
 import os
+import json
+import time
 import pickle
+import warnings
+import contextlib
 import numpy as np
 import pandas as pd
 from spotify_tools import *
+from store_tools import *
+from shard_tools import *
+from results_tools import *
+from registry_tools import *
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 from sklearn.compose import ColumnTransformer
 from sklearn.preprocessing import MinMaxScaler
 from sklearn.pipeline import Pipeline
-from sklearn.model_selection import train_test_split, cross_validate
+from sklearn.model_selection import train_test_split, cross_validate, StratifiedKFold
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.linear_model import LogisticRegression
-from sklearn.svm import SVC
+from sklearn.svm import SVC, LinearSVC
 from sklearn import metrics
 
 
+# Location of the summary index of the example data
+SUMMARY_PATH = 'Data/summary_index.json'
+
+# Default number of artists processed at once by save_random_artist_data()
+INGEST_WORKERS = 4
+
+# Default number of processes used for a grid of cross-validation runs
+CV_WORKERS = os.cpu_count() or 1
+
+# Successive halving defaults: the (number of folds, fraction of training rows) of each rung,
+# the fraction of models promoted at each rung (1/eta), and the fewest rows a subsample can have
+HALVING_RUNGS = [(1, 1/9), (2, 1/3), (5, 1)]
+HALVING_ETA = 3
+MIN_TRAIN_ROWS = 50
+
+# The parameter that can be warm started along a path of models, for each type of model
+PATH_PARAMS = {'RandomForestClassifier':'n_estimators',
+               'LogisticRegression':'C'}
+
+# Default number of label permutations each representative model is fit on by run_permutation_baseline()
+PERMUTATIONS = 10
+
+# The types of model whose class probabilities are saved (and whose predictions are taken from them)
+PROBA_MODELS = ['LogisticRegression', 'RandomForestClassifier']
+
+# The sets of preprocessed folds sent to the worker processes of run_cv_grid()
+_worker_folds = {}
+
+
 
 def pop_classes(pop_vals, cutoffs=[75]):
     """Turn popularity scores into classes based on percentile cutoffs.
@@ -42,35 +81,144 @@ def pop_classes(pop_vals, cutoffs=[75]):
 
 
 
-def seed_data(artist_id, degrees=2):
+def seed_data(artist_id, degrees=2, journal_path=None):
     """Pull the relevant data for a seed artist.
 
     artist_id - the Spotify ID of the seed artist
     degrees - the number of degrees out in the related artists network to search
+    journal_path - if given, each stage (network, tracklist, recs, track frame) is checkpointed
+                   to this JSON journal as it finishes, and stages already in it are not redone
+    Returns (artist_id, net, seed_list, recs, recs_filt, df, member_recs), where member_recs is a
+    dictionary of the tracks recommended for each artist in the network (used by update_seed_data()).
     """
+    # Load the checkpoints of any stages that already finished
+    journal = {}
+    if journal_path is not None and os.path.exists(journal_path):
+        with open(journal_path, 'r') as f:
+            journal = json.load(f)
+
+    def checkpoint(stage, func):
+        """Run a stage (unless it's already in the journal) and record its result."""
+        if stage not in journal:
+            journal[stage] = func()
+            if journal_path is not None:
+                atomic_write_json(journal, journal_path)
+        return journal[stage]
+
     # Get the network of related artists
-    net = related_artists_network(artist_id, degrees)
+    net = checkpoint('network', lambda: related_artists_network(artist_id, degrees))
     
     # Get the seed artist's tracklist id values
-    seed_list = artist_tracklist(artist_id)
-    seed_list = [x[1] for x in seed_list]
+    seed_list = checkpoint('tracklist', lambda: [x[1] for x in artist_tracklist(artist_id)])
     
-    # Get the list of recommended tracks and remove any belonging to the seed artist
-    recs = recommended_tracks(net)
+    # Get the list of recommended tracks (keeping track of each artist's) and remove any belonging to the seed artist
+    member_recs = checkpoint('member_recs', lambda: recommended_tracks(net, by_artist=True))
+    recs = list(set().union(*member_recs.values()))
     recs_filt = list(set(recs).difference(seed_list))
     
     # Get the full dataframe for each track id in the recommendation list
-    if recs_filt:
-        df = track_df(recs_filt)
+    # (checkpointed to a pickle file next to the journal)
+    frame_path = None if journal_path is None else '{}.tracks.pkl'.format(journal_path)
+    if journal.get('track_frame') and os.path.exists(frame_path):
+        with open(frame_path, 'rb') as f:
+            df = pickle.load(f)
     else:
-        # Assign None in case the artist is so small there weren't any recommended artists
-        df = None
-    return (artist_id, net, seed_list, recs, recs_filt, df)
+        if recs_filt:
+            df = track_df(recs_filt)
+        else:
+            # Assign None in case the artist is so small there weren't any recommended artists
+            df = None
+        if journal_path is not None:
+            atomic_write_pickle(df, frame_path)
+            checkpoint('track_frame', lambda: True)
+    return (artist_id, net, seed_list, recs, recs_filt, df, member_recs)
+
 
 
+def clear_journal(journal_path):
+    """Remove a seed_data() journal and its track frame checkpoint once the data has been saved."""
+    for fpath in [journal_path, '{}.tracks.pkl'.format(journal_path)]:
+        if os.path.exists(fpath):
+            os.remove(fpath)
+
+
+
+def update_seed_data(previous, degrees=2):
+    """Incrementally refresh the data for a seed artist from a previous seed_data() snapshot.
+
+    The result matches what a full seed_data() pull would return now, but only what has changed is
+    pulled: the network is read from the artist graph (only artists that are missing or stale are
+    crawled again), new albums are found from the seed artist's album list (album tracklists already
+    in the response cache aren't requested again), recommendations are only requested for artists
+    who joined the network (those of artists who left it are dropped), and only the popularity
+    scores of already known tracks are updated.
+
+    previous - the tuple previously returned by seed_data() (or update_seed_data()) for the artist
+               (snapshots without each artist's recommendations have them all requested again)
+    degrees - the number of degrees out in the related artists network to search
+    """
+    artist_id, prev_net, prev_seed_list, prev_recs, prev_recs_filt, prev_df = previous[:6]
+    prev_member_recs = previous[6] if len(previous) > 6 and previous[6] is not None else {}
+
+    # Update the network of related artists
+    net = related_artists_network(artist_id, degrees)
+
+    # Get the seed artist's tracklist id values
+    seed_list = artist_tracklist(artist_id)
+    seed_list = [x[1] for x in seed_list]
+
+    # Only get the recommended tracks of the artists who joined the network, and remove any belonging to the seed artist
+    joined = [x for x in net if x not in prev_member_recs]
+    member_recs = recommended_tracks(joined, by_artist=True) if joined else {}
+    member_recs = {x:prev_member_recs[x] if x in prev_member_recs else member_recs[x] for x in net}
+    recs = list(set().union(*member_recs.values()))
+    recs_filt = list(set(recs).difference(seed_list))
 
-def save_random_artist_data(start_idx=0, end_idx=3):
-    """Go through a slice of the random_artists seed list and generate/save the data needed for modeling tests."""
+    # Keep the known tracks that are still recommended, with refreshed popularity scores
+    if prev_df is not None:
+        df = prev_df[prev_df['Track_ID'].isin(recs_filt)]
+        popularity = track_popularity(list(df['Track_ID']))
+        df = df[df['Track_ID'].isin(list(popularity))].copy()
+        df['Track_Popularity'] = df['Track_ID'].map(popularity).astype(df['Track_Popularity'].dtype)
+        known = set(prev_df['Track_ID'])
+    else:
+        df = None
+        known = set()
+
+    # Get the full dataframe for the newly recommended tracks and merge it in
+    new_tracks = [x for x in recs_filt if x not in known]
+    if new_tracks:
+        new_df = track_df(new_tracks)
+        if df is None:
+            df = new_df
+        else:
+            df = pd.concat([df, new_df], ignore_index=True)
+    if df is not None:
+        df = df.reset_index(drop=True)
+    return (artist_id, net, seed_list, recs, recs_filt, df, member_recs)
+
+
+
+def save_random_artist_data(start_idx=0, end_idx=3, incremental=False, store_dir=STORE_DIR,
+                            n_workers=INGEST_WORKERS, shard_id=None, shard_count=1):
+    """Go through a slice of the random_artists seed list and generate/save the data needed for modeling tests.
+
+    Artists are processed by a pool of worker threads (the work is mostly waiting on the API,
+    whose requests are all paced by the shared scheduler), and saved to the store one at a time
+    as they finish. Each artist's progress is checkpointed to a journal in the store's journal/
+    folder, so an interrupted run picks up where it left off without redoing finished stages.
+
+    start_idx - the index of the first artist in random_artists to process
+    end_idx - the index after the last artist to process
+    incremental - if True, refresh existing datasets with update_seed_data() instead of skipping them
+                  (and compact the store afterwards, see compact_store())
+    store_dir - the location of the columnar dataset store the data is saved to
+    n_workers - the number of artists processed at once (1 processes them serially, in order)
+    shard_id - if given, only process this shard's share of the slice (see shard_tools.py), saving it to
+               its own store (e.g. Data/store_shard_0_of_4), with its own track store, artist graph,
+               and response cache, to be combined with merge_dataset_shards()
+    shard_count - the total number of shards the slice is split into
+    """
     # Load the random_artists list, or create & save it if it doesn't exist
     if os.path.exists('Data/random_artists.pkl'):
         print('Load: random_artists')
@@ -78,43 +226,154 @@ def save_random_artist_data(start_idx=0, end_idx=3):
             random_artists = pickle.load(f)
     else:
         random_artists = get_random_artists()
-        with open('Data/random_artists.pkl', 'wb') as f:
-            pickle.dump(random_artists, f)
+        atomic_write_pickle(random_artists, 'Data/random_artists.pkl')
         print('Saved: random_artists')
 
-    # Get the seed_data for each artist and save it
-    for n, artist in enumerate(random_artists[start_idx:end_idx]):
-        save_name = 'data_artist_{}.pkl'.format(n+start_idx)
-        save_path = 'Data/{}'.format(save_name)
-
-        # Skip this file if it already exists
-        if os.path.exists(save_path):
-            print('Skipped: ', save_name)
+    # Pick out this shard's artists, if sharded
+    filerange = range(start_idx, min(end_idx, len(random_artists)))
+    if shard_id is not None:
+        store_dir = shard_dir(store_dir, shard_id, shard_count)
+        filerange = start_shard(store_dir, 'dataset', filerange, shard_id, shard_count)
+
+    # Find the artists to process (existing datasets are refreshed if incremental, and skipped otherwise)
+    journal_dir = os.path.join(store_dir, 'journal')
+    os.makedirs(journal_dir, exist_ok=True)
+    manifest = load_manifest(store_dir)
+    todo = []
+    for i_file in filerange:
+        artist = random_artists[i_file]
+        prev_data = load_artist_data(i_file, store_dir, manifest)
+        if prev_data is not None and not incremental:
+            if shard_id is not None:
+                complete_shard_item(store_dir, i_file)
+            print('Skipped: ', 'data_artist_{}'.format(i_file))
             continue
+        todo.append((i_file, artist, prev_data))
+
+    def ingest(item):
+        """Get the seed_data for one artist (checkpointing its progress), or refresh its previous data."""
+        i_file, artist, prev_data = item
+        if prev_data is not None:
+            return update_seed_data(prev_data[2])
+        journal_path = os.path.join(journal_dir, 'artist_{}.json'.format(i_file))
+        return seed_data(artist[1], journal_path=journal_path)
+
+    # Save each artist's data as it finishes (only this thread writes to the store),
+    # using the shard's own track store, artist graph, and response cache if sharded
+    with shard_stores(store_dir) if shard_id is not None else contextlib.nullcontext():
+        for (i_file, artist, prev_data), save_data in fetch_concurrent(ingest, todo, n_workers):
+            save_name = 'data_artist_{}'.format(i_file)
+            append_artist(i_file, [save_name, artist, save_data], store_dir)
+            clear_journal(os.path.join(journal_dir, 'artist_{}.json'.format(i_file)))
+            if shard_id is not None:
+                complete_shard_item(store_dir, i_file)
+            print('Updated: ' if prev_data is not None else 'Saved: ', save_name)
+
+    # Drop the rows left behind by the refreshed datasets
+    if incremental and todo:
+        dropped_rows, dropped_tracks = compact_store(store_dir)
+        print('Compacted: ', '{} rows, {} tracks'.format(dropped_rows, dropped_tracks))
+
+
+
+def load_artist(i_file, store_dir=STORE_DIR, manifest=None):
+    """Load the saved data for one example artist, from the dataset store or else its pickle file.
+
+    Returns [save_name, artist, seed_data], or None if there is no data for that artist.
+    """
+    # Use the columnar store if the artist is in it
+    data = load_artist_data(i_file, store_dir, manifest)
+    if data is not None:
+        return data
 
-        # Create and save the data
-        save_data = seed_data(artist[1])
-        with open(save_path, 'wb') as f:
-            pickle.dump([save_name, artist, save_data], f)
-        print('Saved: ', save_name)
+    # Fall back to the original per-artist pickle files
+    fpath = 'Data/data_artist_{}.pkl'.format(i_file)
+    if not os.path.exists(fpath):
+        return None
+    with open(fpath, 'rb') as f:
+        return pickle.load(f)
 
 
 
-def load_sample_data(filerange=range(201)):
+def load_sample_data(filerange=range(201), store_dir=STORE_DIR):
     """Load the saved example artist data for evaluation."""
-    # Load the data
+    # Load the data (reading the store manifest only once)
+    manifest = load_manifest(store_dir)
     results_list = []
     for i_file in filerange:
-        fpath = 'Data/data_artist_{}.pkl'.format(i_file)
-        if not os.path.exists(fpath):
+        results = load_artist(i_file, store_dir, manifest)
+        if results is None:
             continue
-        with open(fpath, 'rb') as f:
-            results = pickle.load(f)
         results_list.append(results)
     return results_list
 
 
 
+def data_signature(i_file, store_dir=STORE_DIR, manifest=None):
+    """Return a signature of an example artist's saved data that changes whenever the data does (None if there is none)."""
+    if manifest is None:
+        manifest = load_manifest(store_dir)
+
+    # Artists in the store are identified by their rows and side table
+    entry = manifest['artists'].get(str(i_file))
+    if entry is not None:
+        side = os.stat(os.path.join(store_dir, 'side', 'artist_{}.json'.format(i_file)))
+        return ['store', entry['offset'], entry['length'], side.st_mtime_ns, side.st_size]
+
+    # Otherwise use the pickle file
+    fpath = 'Data/data_artist_{}.pkl'.format(i_file)
+    if os.path.exists(fpath):
+        stat = os.stat(fpath)
+        return ['pickle', stat.st_mtime_ns, stat.st_size]
+    return None
+
+
+
+def load_summary_index(filerange=range(201), store_dir=STORE_DIR, index_path=SUMMARY_PATH):
+    """Load the per-artist summary of the example data, only re-reading datasets that changed since it was built.
+
+    Returns a dataframe indexed by file number with the follower count, network size,
+    tracklist size, and recommendation list size of each artist.
+    """
+    # Load the saved index
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path, 'r') as f:
+            index = json.load(f)
+
+    # Rebuild the entries whose data has changed (or is new), and drop the ones whose data is gone
+    manifest = load_manifest(store_dir)
+    changed = False
+    for i_file in filerange:
+        key = str(i_file)
+        sig = data_signature(i_file, store_dir, manifest)
+        if sig is None:
+            changed = changed or key in index
+            index.pop(key, None)
+            continue
+        if key in index and index[key]['signature'] == sig:
+            continue
+        res = load_artist(i_file, store_dir, manifest)
+        index[key] = {'signature':sig,
+                      'followers':res[1][2],
+                      'network_size':len(res[2][1]),
+                      'tracklist_size':len(res[2][2]),
+                      'reclist_size':len(res[2][4])}
+        changed = True
+
+    # Save the index if anything was updated
+    if changed:
+        atomic_write_json(index, index_path)
+
+    # Return the summary of the requested artists
+    rows = [i_file for i_file in filerange if str(i_file) in index]
+    summary = pd.DataFrame([index[str(i_file)] for i_file in rows],
+                           index=rows,
+                           columns=['followers', 'network_size', 'tracklist_size', 'reclist_size'])
+    return summary
+
+
+
 def drop_cols(input_df):
     """Drop the irrelevant columns of the input dataframe."""
     # Drop the columns
@@ -218,8 +477,29 @@ def make_SVC_list(c_list):
 
 
 
-def build_pipeline(input_model):
-    """Build the pipeline object for classification."""
+def make_SVM_list(c_list):
+    """Create a list of different linear Support Vector Machine models to search through.
+
+    This is the scalable stand-in for make_SVC_list(): the liblinear solver (squared hinge loss,
+    solved in the primal) grows linearly with the number of tracks, where the kernel solver of
+    SVC grows quadratically.
+    """
+    # Check if c_list is not already a list
+    if not isinstance(c_list, list):
+        c_list = [c_list]
+
+    models = []
+    for c_val in c_list:
+        models.append(LinearSVC(class_weight='balanced',
+                                C=c_val,
+                                dual=False,
+                                random_state=0))
+    return models
+
+
+
+def build_preprocessor():
+    """Build the column transformer used to preprocess the data before classification."""
     # Select the columns to be re-scaled and dropped
     cols2scale = ['Track_Duration', 'Track_Loudness', 'Track_Tempo']
     cols2drop = ['Track_Key', 'Track_TimeSig']
@@ -228,6 +508,14 @@ def build_pipeline(input_model):
     ct = ColumnTransformer([('scaler', MinMaxScaler(), cols2scale),
                             ('drop_cols', 'drop', cols2drop)],
                            remainder='passthrough')
+    return ct, cols2scale, cols2drop
+
+
+
+def build_pipeline(input_model):
+    """Build the pipeline object for classification."""
+    # Set up the column transformer for preprocessing
+    ct, cols2scale, cols2drop = build_preprocessor()
     
     # Set up the pipeline object
     pipeline = Pipeline([('preprocess', ct),
@@ -236,20 +524,362 @@ def build_pipeline(input_model):
 
 
 
-def run_cv(input_model, X_train, y_train):
-    """Run the cross-validation on the input model."""
-    # Set up the pipeline object
-    pipeline, cols2scale, cols2drop = build_pipeline(input_model)
+def prep_folds(X_train, y_train, X_test, cv=5):
+    """Preprocess the cross-validation folds of a training set once, so every model can reuse them.
+
+    The folds are the same ones cross_validate() uses (stratified, in order), and each fold's column
+    transformer is fit on that fold's training rows, just as it is inside the pipeline.
+
+    Returns a list with a dictionary for each fold of its training and validation row positions
+    ('train' and 'test'), the preprocessed training set ('X'), and the preprocessed hold-out set ('X_holdout').
+    """
+    folds = []
+    for train, test in StratifiedKFold(cv).split(X_train, y_train):
+        ct, cols2scale, cols2drop = build_preprocessor()
+        ct.fit(X_train.iloc[train])
+        folds.append({'train':train,
+                      'test':test,
+                      'X':ct.transform(X_train),
+                      'X_holdout':ct.transform(X_test)})
+    return folds
+
+
+
+def run_cv(input_model, X_train, y_train, folds=None):
+    """Run the cross-validation on the input model.
+
+    folds - preprocessed folds from prep_folds() (optional), in which case only the model is fit
+            on each fold, and the estimators returned are the fitted models rather than pipelines
+    """
+    if folds is None:
+        # Set up the pipeline object
+        pipeline, cols2scale, cols2drop = build_pipeline(input_model)
+
+        # Run the cross-validation and return the results
+        cv_results = cross_validate(pipeline,
+                                    X_train,
+                                    y_train,
+                                    scoring='recall',
+                                    cv=5,
+                                    return_train_score=True,
+                                    return_estimator=True)
+        return cv_results
+
+    # Fit and score a copy of the model on each of the preprocessed folds
+    y_train = np.asarray(y_train)
+    cv_results = {'fit_time':[], 'score_time':[], 'estimator':[], 'test_score':[], 'train_score':[]}
+    for fold in folds:
+        X, train, test = fold['X'], fold['train'], fold['test']
+        est = clone(input_model)
+        start = time.time()
+        est.fit(X[train], y_train[train])
+        cv_results['fit_time'].append(time.time() - start)
+        start = time.time()
+        cv_results['test_score'].append(metrics.recall_score(y_train[test], est.predict(X[test])))
+        cv_results['score_time'].append(time.time() - start)
+        cv_results['train_score'].append(metrics.recall_score(y_train[train], est.predict(X[train])))
+        cv_results['estimator'].append(est)
+    return {k:(v if k == 'estimator' else np.array(v)) for k, v in cv_results.items()}
+
+
+
+def predict_holdout(est, X_holdout):
+    """Predict the hold-out set with a fitted estimator in a single pass.
+
+    est - the fitted estimator (a pipeline, or a bare model)
+    Returns the predictions and the class probabilities (None unless the model is in PROBA_MODELS).
+    For LR and RFC, the predictions are taken from the probabilities (positive above 0.5, as predict()
+    does) instead of running the model, and its preprocessing, a second time.
+    """
+    model = est['model'] if isinstance(est, Pipeline) else est
+    if model.__class__.__name__ not in PROBA_MODELS:
+        return est.predict(X_holdout), None
+    y_pp = est.predict_proba(X_holdout)
+    return model.classes_[(y_pp[:, 1] > 0.5).astype(int)], y_pp
+
+
+
+def batch_recall(y_true, y_preds):
+    """Compute the recall of several sets of predictions at once.
+
+    y_true - the true labels
+    y_preds - a list (or 2D array) of predictions, one set per estimator
+    Returns an array of recall scores, the same as recall_score() on each set (0 if there are no positives).
+    """
+    y_true = np.asarray(y_true) == 1
+    y_preds = np.asarray(y_preds) == 1
+    positives = y_true.sum()
+    if not positives:
+        return np.zeros(len(y_preds))
+    return (y_preds & y_true).sum(axis=1) / positives
+
+
+
+def model_paths(models, warm_start=True):
+    """Group a list of models into paths that can be fit one after another with warm starts.
+
+    Models of a type in PATH_PARAMS that only differ in that parameter make a path (in increasing
+    order), e.g. random forests of 50, 100, and 200 trees at the same depth, where each forest only
+    grows the trees the previous one didn't have, or linear models along increasing C, where each
+    solve starts from the previous solution. Every other model is a path of its own.
+
+    models - the list of models
+    warm_start - if False, every model is a path of its own
+    Returns a list of paths, each a list of positions in the list of models.
+    """
+    paths = []
+    groups = {}
+    for n, model in enumerate(models):
+        name = model.__class__.__name__
+        if not warm_start or name not in PATH_PARAMS:
+            paths.append([n])
+            continue
+        # Models with the same type and parameters (apart from the path's) go on the same path
+        params = model.get_params()
+        key = (name, json.dumps({k:v for k, v in params.items() if k != PATH_PARAMS[name]},
+                                sort_keys=True, default=str))
+        if key not in groups:
+            groups[key] = []
+            paths.append(groups[key])
+        groups[key].append(n)
+
+    # Order each path along its parameter
+    path_value = lambda n: models[n].get_params()[PATH_PARAMS[models[n].__class__.__name__]]
+    return [path if len(path) == 1 else sorted(path, key=path_value) for path in paths]
+
+
+
+def run_path_cell(models, X_train, y_train, X_test, y_test, folds=None, n_folds=None, train_fraction=1):
+    """Run the cross-validation on a path of models (see model_paths()), warm starting each model from the last.
+
+    Each fold's estimator is fit for the first model on the path, then its parameters are changed
+    to the next model's and it is fit again from where it left off, scoring it at each step.
+    The fit times are cumulative (the time taken to reach that model along the path).
+
+    folds - preprocessed folds from prep_folds() (made from X_train and X_test if not given)
+    n_folds - the number of folds to run (all of them by default)
+    train_fraction - the fraction of each fold's training rows to fit on (a fixed, stratified subsample)
+    Returns a list with the results dictionary of each model (in the saved format, see results_tools.py),
+    which also records the number of rows each estimator was fit on ('n_train').
+    """
+    if folds is None:
+        folds = prep_folds(X_train, y_train, X_test)
+    y_train = np.asarray(y_train)
+
+    results = [{k:[] for k in KEY_ORDER + ['n_train']} for model in models]
+    for fold in folds[:n_folds]:
+        X, train, test = fold['X'], fold['train'], fold['test']
+        # Subsample the training rows (unless there would be too few to be meaningful)
+        if train_fraction < 1 and len(train) * train_fraction >= MIN_TRAIN_ROWS:
+            train, _ = train_test_split(train, train_size=train_fraction, stratify=y_train[train], random_state=0)
+            train = np.sort(train)
+        est = clone(models[0])
+        fit_time = 0
+        for model, r in zip(models, results):
+            # Move the estimator along to this model's parameters, and continue fitting it
+            params = model.get_params()
+            if len(models) > 1:
+                params['warm_start'] = True
+            est.set_params(**params)
+            start = time.time()
+            with warnings.catch_warnings():
+                # Forests warn about class weight presets with warm starts, which is only a concern
+                # if the data changes between fits (here it's the same fold every time)
+                warnings.filterwarnings('ignore', message='class_weight presets')
+                est.fit(X[train], y_train[train])
+            fit_time += time.time() - start
+            r['fit_time'].append(fit_time)
+
+            # Score it on the fold and the hold-out set
+            start = time.time()
+            r['test_score'].append(metrics.recall_score(y_train[test], est.predict(X[test])))
+            r['score_time'].append(time.time() - start)
+            r['train_score'].append(metrics.recall_score(y_train[train], est.predict(X[train])))
+            y_pred, y_pp = predict_holdout(est, fold['X_holdout'])
+            r['y_pred'].append(y_pred)
+            r['y_pred_proba'].append(y_pp)
+            r['n_train'].append(len(train))
+
+    # Score every estimator's hold-out predictions at once, and store the scores
+    # and times as arrays, as cross_validate() does
+    for r in results:
+        r['holdout_score'] = batch_recall(y_test, r['y_pred'])
+        for k in ['fit_time', 'score_time', 'train_score', 'test_score', 'n_train']:
+            r[k] = np.array(r[k])
+    return results
+
+
+
+def run_halving(models, y_train, y_test, folds, rungs=HALVING_RUNGS, eta=HALVING_ETA, budget=None,
+                n_workers=CV_WORKERS):
+    """Race a list of models with successive halving, pruning the losers on small amounts of data.
+
+    Every model is scored at the first rung (e.g. one fold on a ninth of the training rows), and only
+    the best 1/eta of them (by their mean validation recall at that rung) are promoted to the next,
+    which uses more folds and more of the data, until the last rung is full cross-validation. Every
+    estimator fit along the way is kept in the results, with the rung it was fit at ('rung') and the
+    number of rows it was fit on ('n_train'), so a pruned model has fewer estimators than a finalist.
+
+    models - the list of models to race
+    y_train, y_test - the training and hold-out labels
+    folds - preprocessed folds from prep_folds()
+    rungs - a list of (number of folds, fraction of training rows) for each rung
+    eta - the fraction of models kept at each rung is 1/eta
+    budget - the number of seconds of fitting allowed (per call), or None for no limit; the
+             first rung always runs, and later rungs only promote the models expected to fit in
+             what's left (based on their fit times at the previous rung)
+    n_workers - the number of processes each rung is run on
+    Returns a list with the results dictionary of each model (in the saved format, see results_tools.py).
+    """
+    results = [{k:[] for k in KEY_ORDER + ['n_train', 'rung']} for model in models]
+    alive = list(range(len(models)))
+    last_cost = {}
+    spent = 0
+    for r, (n_folds, fraction) in enumerate(rungs):
+        if r > 0:
+            # Promote the best models from the last rung (ties go to the earlier model)
+            score = lambda n: np.mean(results[n]['test_score'][-rungs[r-1][0]:])
+            alive = sorted(alive, key=lambda n: (-score(n), n))[:int(np.ceil(len(alive) / eta))]
+
+            # Only promote as many as are expected to fit in the remaining budget
+            if budget is not None:
+                scale = (n_folds * fraction) / (rungs[r-1][0] * rungs[r-1][1])
+                expected = np.cumsum([last_cost[n] * scale for n in alive])
+                alive = [n for n, c in zip(alive, expected) if spent + c <= budget]
+                if not alive:
+                    break
+
+        # Score the models still in the race at this rung
+        cells = [([n], [models[n]], None, y_train, None, y_test, folds, n_folds, fraction) for n in alive]
+        for n, res in run_cv_grid(cells, n_workers):
+            for k in KEY_ORDER + ['n_train']:
+                results[n][k].extend(res[k])
+            results[n]['rung'].extend([r] * len(res['fit_time']))
+            last_cost[n] = res['fit_time'].sum()
+            spent += last_cost[n]
+
+    # Store the scores and times as arrays, as cross_validate() does
+    for res in results:
+        for k in ['fit_time', 'score_time', 'train_score', 'test_score', 'holdout_score', 'n_train', 'rung']:
+            res[k] = np.array(res[k])
+    return results
+
+
+
+def representative_models(models, results):
+    """Pick the best model of each type (by mean validation recall on the real labels) to stand in for the rest.
+
+    Models fit on more folds are preferred (i.e. the finalists, after successive halving), and ties go to the earlier model.
+    Returns the positions of the representative models in the list of models.
+    """
+    best = {}
+    for n, (model, r) in enumerate(zip(models, results)):
+        name = model.__class__.__name__
+        key = (len(r['test_score']), np.mean(r['test_score']))
+        if name not in best or key > best[name][0]:
+            best[name] = (key, n)
+    return sorted(n for key, n in best.values())
+
+
+
+def run_permutation_baseline(models, y_train, y_test, folds, n_permutations=PERMUTATIONS, n_workers=CV_WORKERS):
+    """Estimate the chance-level hold-out recall of some models by fitting them on permuted training labels.
+
+    Rather than cross-validating every model a second time on shuffled labels, each model (e.g. one
+    per type, from representative_models()) is fit once per permutation of the training labels, on a
+    single fold (rotating through the folds) of the already preprocessed folds, and its hold-out
+    predictions are scored against the real hold-out labels. The fits are run as cells on the process pool.
+
+    models - the list of models to fit
+    y_train, y_test - the training and hold-out labels
+    folds - preprocessed folds from prep_folds() (the preprocessing doesn't depend on the labels)
+    n_permutations - the number of permutations of the training labels (each is seeded by its number)
+    n_workers - the number of processes
+    Returns an array of the hold-out recall scores, of shape (models, permutations), and an array
+    of the hold-out predictions, of shape (models, permutations, hold-out rows).
+    """
+    y_train = np.asarray(y_train)
+    single_folds = [[fold] for fold in folds]
+    cells = []
+    for p in range(n_permutations):
+        y_perm = np.random.RandomState(p).permutation(y_train)
+        cells.extend(([(n, p)], [model], None, y_perm, None, y_test, single_folds[p % len(folds)], 1)
+                     for n, model in enumerate(models))
+    scores = np.zeros((len(models), n_permutations))
+    y_preds = np.zeros((len(models), n_permutations, len(y_test)), dtype=np.int8)
+    for (n, p), r in run_cv_grid(cells, n_workers):
+        scores[n, p] = r['holdout_score'][0]
+        y_preds[n, p] = r['y_pred'][0]
+    return scores, y_preds
+
+
+
+def expected_cost(input_model, n_rows):
+    """Roughly estimate the relative cost of cross-validating a model on a number of rows (for scheduling)."""
+    name = input_model.__class__.__name__
+    params = input_model.get_params()
+    if name == 'RandomForestClassifier':
+        # Trees are grown in n log n time, for each tree and level of depth
+        return params['n_estimators'] * (params['max_depth'] or 20) * n_rows * np.log2(n_rows + 2) / 20
+    if name == 'SVC':
+        # Kernel solvers scale quadratically with the rows, and take longer to converge at high C
+        return n_rows ** 2 * max(1, np.log10(params['C'] * 10)) / 10
+    if name == 'LinearSVC':
+        # The primal liblinear solver takes a few cheap passes over the rows
+        return n_rows * 10
+    # Linear solvers take one pass over the rows per iteration
+    return n_rows * 100
+
+
+
+def run_cv_grid(cells, n_workers=CV_WORKERS):
+    """Run a grid of cross-validation cells on a pool of processes, yielding (key, results) pairs as they finish.
+
+    The cells are started in order of their expected cost (largest first), so that slow cells
+    don't end up running alone at the end while the rest of the pool sits idle. The results
+    are the same whichever order they finish in, so callers should place them by their keys.
+
+    cells - a list of (keys, models, X_train, y_train, X_test, y_test, folds) tuples, where models
+            is a path of models (see model_paths() and run_path_cell()), keys is a label for each
+            model (e.g. its artist, model number, and label set), and folds is the preprocessed
+            folds from prep_folds() (or None), optionally followed by the number of folds and
+            the fraction of training rows to run
+    n_workers - the number of processes (1 runs the cells in this process, in order)
+
+    Each distinct set of folds is only sent to each worker process once, when the pool starts
+    (cells sharing a set of folds should pass the same list, rather than copies or slices of it).
+    """
+    if n_workers <= 1:
+        for keys, *args in cells:
+            yield from zip(keys, run_path_cell(*args))
+        return
+
+    # A path costs about as much as its last (largest) model
+    order = sorted(cells, key=lambda cell: -max(expected_cost(m, len(cell[3])) for m in cell[1]))
+
+    # Send each set of folds to the workers once, when they start, and only a key to it with each cell
+    fold_sets = {}
+    tasks = []
+    for keys, models, X_train, y_train, X_test, y_test, folds, *args in order:
+        fold_sets[id(folds)] = folds
+        tasks.append((keys, (id(folds), models, X_train, y_train, X_test, y_test, *args)))
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(fold_sets,)) as pool:
+        futures = {pool.submit(_run_worker_cell, *args):keys for keys, args in tasks}
+        for future in as_completed(futures):
+            yield from zip(futures[future], future.result())
 
-    # Run the cross-validation and return the results
-    cv_results = cross_validate(pipeline,
-                                X_train,
-                                y_train,
-                                scoring='recall',
-                                cv=5,
-                                return_train_score=True,
-                                return_estimator=True)
-    return cv_results
+
+
+def _init_worker(fold_sets):
+    """Keep the sets of preprocessed folds of a run_cv_grid() call in a worker process."""
+    global _worker_folds
+    _worker_folds = fold_sets
+
+
+
+def _run_worker_cell(folds_key, models, X_train, y_train, X_test, y_test, *args):
+    """Run a cell (see run_path_cell()) in a worker process, with the folds it was sent when it started."""
+    return run_path_cell(models, X_train, y_train, X_test, y_test, _worker_folds[folds_key], *args)
 
 
 
@@ -259,7 +889,9 @@ def prep_data_streamlit(artist_library_df, reclist_df):
     artist_library_df - the tracklist of the original seed artist with all metadata
     reclist_df - the tracklist of the recommended tracks with all the metadata
     """
-    # Generate X_train and y_train based on the recommended tracks dataframe
+    # Generate X_train and y_train based on the recommended tracks dataframe, in a fixed track order
+    # (the recommendations come out of a set, and the model registry's fingerprint depends on row order)
+    reclist_df = reclist_df.sort_values('Track_ID', kind='stable').reset_index(drop=True)
     feats_train = drop_cols(reclist_df)
     X_train = feats_train.drop(['Track_Popularity'], axis=1)
     y_vals_train = feats_train['Track_Popularity']
@@ -278,6 +910,45 @@ def prep_data_streamlit(artist_library_df, reclist_df):
 
 
 
+def fit_streamlit_model(X_train, y_train, input_model):
+    """Fit the front-end's model and compute its feature importances, reusing them from the model registry if possible.
+
+    The artifacts are stored in the registry (see registry_tools.py) under a fingerprint of the training
+    data and the model's parameters, so a repeat visit with the same recommended tracks skips training.
+
+    X_train, y_train - the training data from prep_data_streamlit()
+    input_model - the (unfitted) random forest model
+    Returns a dictionary of the fitted pipeline ('pipeline'), the preprocessed training set with
+    readable column labels ('X_trans'), and the output of get_RFC_importances() ('importances').
+    """
+    registry = get_registry()
+    if registry is not None:
+        key = fingerprint(X_train, y_train, input_model)
+        artifacts = registry.get(key)
+        if artifacts is not None:
+            return artifacts
+
+    # Set up and fit the model
+    clf, cols2scale, cols2drop = build_pipeline(input_model)
+    clf.fit(X_train, y_train)
+
+    # Generate the feature names
+    new_cols = [c for c in X_train.columns if c not in cols2scale+cols2drop]
+    new_cols = cols2scale + new_cols
+    col_labels = [x.replace('Track_', '') for x in new_cols]
+
+    # Preprocess X_train for calculating feature importance
+    X_trans = clf['preprocess'].transform(X_train)
+    X_trans = pd.DataFrame({k:X_trans[:,n] for n, k in enumerate(col_labels)})
+    importances = get_RFC_importances(clf['model'], X_trans, y_train, col_labels)
+
+    artifacts = {'pipeline':clf, 'X_trans':X_trans, 'importances':importances}
+    if registry is not None:
+        registry.put(key, artifacts)
+    return artifacts
+
+
+
 def get_RFC_importances(forest, X_trans, y_train, col_labels):
     """Calculate and sort feaure importances from the random forest classifier.
     
@@ -293,8 +964,8 @@ def get_RFC_importances(forest, X_trans, y_train, col_labels):
     # Filter X_trans into positive and negative class samples, and take the mean across features
     pop1 = X_trans[y_train == 1]
     pop0 = X_trans[y_train == 0]
-    mean1 = pop1.mean(axis=0)
-    mean0 = pop0.mean(axis=0)
+    mean1 = np.asarray(pop1.mean(axis=0))
+    mean0 = np.asarray(pop0.mean(axis=0))
     
     # For classes where smaller values drive popularity, flip the sign and the bar color for that feature
     barcolors = ['b'] * len(imp_mean)
@@ -76,13 +76,9 @@ def plot_correlations(input_df):
 
 def plot_follower_count(filerange=range(201), plot_legend=False):
     """Plot the distribution of followers from the evaluation sample of artists."""
-    # Load the data
-    results_list = load_sample_data(filerange)
-
-    # Get the follower counts from the evaluation sample
-    followers = []
-    for res in results_list:
-        followers.append(res[1][2])
+    # Get the follower counts from the evaluation sample (via the summary index)
+    summary = load_summary_index(filerange)
+    followers = list(summary['followers'])
 
     # Get the follower counts from the full 2000 random artist list for comparison
     fpath = 'Data/random_artists.pkl'
@@ -111,13 +107,9 @@ def plot_follower_count(filerange=range(201), plot_legend=False):
 
 def plot_network_sizes(filerange=range(201)):
     """Plot the distribution of network sizes in the evaluation sample of artists."""
-    # Load the data
-    results_list = load_sample_data(filerange)
-
-    # Pull out the length of each network
-    all_nets = []
-    for res in results_list:
-        all_nets.append(len(res[2][1]))
+    # Pull out the length of each network (via the summary index)
+    summary = load_summary_index(filerange)
+    all_nets = list(summary['network_size'])
     
     # Set the bins for the histogram
     data, binning = rebin(all_nets, 25)
@@ -135,13 +127,9 @@ def plot_network_sizes(filerange=range(201)):
 
 def plot_tracklist_sizes(filerange=range(201)):
     """Plot the distribution of seed artist tracklist sizes in the evaluation sample of artists."""
-    # Load the data
-    results_list = load_sample_data(filerange)
-
-    # Pull out the length of each track list
-    all_tracklists = []
-    for res in results_list:
-        all_tracklists.append(len(res[2][2]))
+    # Pull out the length of each track list (via the summary index)
+    summary = load_summary_index(filerange)
+    all_tracklists = list(summary['tracklist_size'])
 
     # Set the bins for the histogram
     data, binning = rebin(np.log10(np.array(all_tracklists) + 1), 0.25) # +1 in case of log(0)
@@ -160,13 +148,9 @@ def plot_tracklist_sizes(filerange=range(201)):
 
 def plot_reclist_sizes(filerange=range(201)):
     """Plot the distribution of recommended tracklist sizes in the evaluation sample of artists."""
-    # Load the data
-    results_list = load_sample_data(filerange)
-
-    # Pull out the length of each recommendation list
-    all_recs = []
-    for res in results_list:
-        all_recs.append(len(res[2][4]))
+    # Pull out the length of each recommendation list (via the summary index)
+    summary = load_summary_index(filerange)
+    all_recs = list(summary['reclist_size'])
 
     # Set the bins for the histogram
     data, binning = rebin(all_recs, 1000)
@@ -0,0 +1,132 @@
+"""Functions used for caching the dashboard's fitted models on disk between runs."""
+
+
+# Import libraries
+import os
+import json
+import time
+import pickle
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+import sklearn
+from store_tools import atomic_write_pickle
+
+
+# Default location of the model registry
+REGISTRY_DIR = 'Data/model_registry'
+
+# Maximum number of fitted models kept before the least recently used are evicted
+MAX_MODELS = 50
+
+# The process-wide registry, opened on first use or replaced with set_registry()
+_registry = None
+_registry_enabled = True
+_registry_lock = threading.Lock()
+
+
+
+def fingerprint(X_train, y_train, input_model):
+    """Hash a training set and an (unfitted) model into the key its fitted artifacts are stored under.
+
+    The key covers the training frame's columns, types, and values, the labels, the model's class
+    and parameters, and the scikit-learn version (so models pickled by another version are refit).
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps([list(X_train.columns), [str(t) for t in X_train.dtypes]]).encode())
+    h.update(pd.util.hash_pandas_object(X_train, index=False).values.tobytes())
+    h.update(np.asarray(y_train, dtype=np.int64).tobytes())
+    params = json.dumps(input_model.get_params(), sort_keys=True, default=str)
+    h.update('{}{}{}'.format(input_model.__class__.__name__, params, sklearn.__version__).encode())
+    return h.hexdigest()
+
+
+
+class ModelRegistry:
+    """Folder of fitted models and their derived artifacts, keyed by fingerprint().
+
+    Each entry is a pickled dictionary (e.g. the fitted pipeline, its feature importances, and the
+    preprocessed training matrix). An entry's modification time is updated whenever it is read, and
+    the least recently used entries are deleted once there are more than max_entries of them.
+
+    path - the folder the entries are saved to
+    max_entries - the size cap, beyond which the least recently used entries are evicted
+    """
+    def __init__(self, path=REGISTRY_DIR, max_entries=MAX_MODELS):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, '{}.pkl'.format(key))
+
+    def get(self, key):
+        """Return the artifacts stored under a key (None if there aren't any, or they can't be read)."""
+        fpath = self._entry_path(key)
+        with self._lock:
+            try:
+                with open(fpath, 'rb') as f:
+                    artifacts = pickle.load(f)
+                # Mark the entry as recently used for the LRU eviction
+                os.utime(fpath)
+            except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return artifacts
+
+    def put(self, key, artifacts):
+        """Store a dictionary of artifacts under a key."""
+        with self._lock:
+            atomic_write_pickle(artifacts, self._entry_path(key))
+            self._evict()
+
+    def _evict(self):
+        """Delete the least recently used entries beyond the size cap (lock must be held)."""
+        entries = [e for e in os.scandir(self.path) if e.name.endswith('.pkl')]
+        if len(entries) > self.max_entries:
+            entries.sort(key=lambda e: e.stat().st_mtime)
+            for e in entries[:len(entries) - self.max_entries]:
+                os.remove(e.path)
+
+    def clear(self):
+        """Delete every entry and reset the counters."""
+        with self._lock:
+            for e in os.scandir(self.path):
+                if e.name.endswith('.pkl'):
+                    os.remove(e.path)
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """Return the hit and miss counts as a dictionary."""
+        return {'hits':self.hits, 'misses':self.misses}
+
+
+
+def get_registry():
+    """Return the process-wide model registry, opening it on first use (None if disabled)."""
+    global _registry
+    if not _registry_enabled:
+        return None
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ModelRegistry()
+    return _registry
+
+
+
+def set_registry(registry):
+    """Replace the model registry used by fit_streamlit_model().
+
+    registry - a ModelRegistry object, or None to turn the registry off
+    """
+    global _registry, _registry_enabled
+    with _registry_lock:
+        _registry = registry
+        _registry_enabled = registry is not None
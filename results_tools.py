@@ -0,0 +1,307 @@
+"""Functions used for saving and loading cross-validation results in a compact format.
+
+Each artist's results are saved to a compressed .npz file (cv_results_artist_#.npz) holding:
+    meta - JSON with the save name, the result keys, the feature columns, and the class and parameters of each model
+    split/<name> - the train/test row indices into the artist's dataset, and the int8 labels
+                   (real and shuffled), instead of copies of the dataframes
+    <label_set>/<model #>/<key> - for the 'real' and 'baseline' (shuffled) labels, the float32 times
+                                  and scores, int8 predictions, float32 class probabilities, and
+                                  (when present) the int32 training sizes and search rungs
+    permutation/<key> - with the permutation baseline (instead of the 'baseline' label set), the
+                        representative models and their hold-out recall and predictions on each label permutation
+    gap/<key> - the gap between the hold-out recall on the real and shuffled labels, with its confidence
+                interval (from resampling the hold-out tracks), for every model (or every representative model)
+Arrays are only read from disk when they are accessed, so single models or metrics load lazily.
+"""
+
+
+# Import libraries
+import os
+import json
+import pickle
+import numpy as np
+
+
+# Order of the keys in each model's results
+KEY_ORDER = ['fit_time', 'score_time', 'train_score', 'test_score', 'holdout_score', 'y_pred', 'y_pred_proba']
+
+# Optional integer keys saved when present: the number of rows each estimator was fit on,
+# and the successive halving rung it was fit at
+EXTRA_KEYS = ['n_train', 'rung']
+
+# The label sets results are stored for (the real labels and the shuffled baseline)
+LABEL_SETS = ['real', 'baseline']
+
+# Number of bootstrap resamples, and the confidence level, of the interval around each recall gap
+GAP_BOOTSTRAPS = 1000
+GAP_LEVEL = 0.95
+
+# Names of the items in a split, in the order returned by split_df()
+SPLIT_NAMES = ['X_train', 'X_test', 'y_train', 'y_test', 'y_train_shuffled', 'y_test_shuffled']
+
+
+
+def cv_results_path(i_file, data_dir='Data'):
+    """Return the path of the compact cross-validation results for an artist."""
+    return os.path.join(data_dir, 'cv_results_artist_{}.npz'.format(i_file))
+
+
+
+def model_description(model):
+    """Describe a model by its class name and parameters (as JSON-friendly values)."""
+    params = json.loads(json.dumps(model.get_params(), default=str))
+    return {'class':model.__class__.__name__, 'params':params}
+
+
+
+def pack_results(label_set, n, r):
+    """Convert one model's results dictionary to compact arrays keyed by their .npz names."""
+    arrays = {}
+    prefix = '{}/{}/'.format(label_set, n)
+    for key in ['fit_time', 'score_time', 'train_score', 'test_score', 'holdout_score']:
+        arrays[prefix + key] = np.asarray(r[key], dtype=np.float32)
+    for key in EXTRA_KEYS:
+        if key in r:
+            arrays[prefix + key] = np.asarray(r[key], dtype=np.int32)
+    arrays[prefix + 'y_pred'] = np.asarray(r['y_pred'], dtype=np.int8)
+    # Class probabilities only exist for some models
+    if r['y_pred_proba'] and r['y_pred_proba'][0] is not None:
+        arrays[prefix + 'y_pred_proba'] = np.asarray(r['y_pred_proba'], dtype=np.float32)
+    return arrays
+
+
+
+def final_scores(r, key='holdout_score'):
+    """Return one model's scores from its last successive halving rung (or all of them, for a grid search)."""
+    scores = np.asarray(r[key])
+    if 'rung' in r:
+        return scores[np.asarray(r['rung']) == np.max(r['rung'])]
+    return scores
+
+
+
+def recall_gap(y_true, y_preds, y_true_null, y_preds_null, n_boot=GAP_BOOTSTRAPS, level=GAP_LEVEL):
+    """Compare a model's hold-out recall on the real labels with its recall on shuffled labels.
+
+    The confidence interval comes from resampling the hold-out tracks (the same resample for both sides),
+    rather than from the handful of fold or permutation scores, which are too few to bootstrap.
+
+    y_true - the real hold-out labels
+    y_preds - the hold-out predictions of the model's estimators on the real labels (one set per fold)
+    y_true_null - the hold-out labels the shuffled estimators are scored against
+    y_preds_null - the hold-out predictions of the estimators fit on shuffled labels (one set per fold or permutation)
+    n_boot - the number of bootstrap resamples of the hold-out tracks
+    level - the confidence level of the interval
+    Returns the gap in mean recall, and its (low, high) bootstrap confidence interval.
+    """
+    y_true = np.asarray(y_true) == 1
+    y_true_null = np.asarray(y_true_null) == 1
+    hits = (np.asarray(y_preds) == 1) & y_true
+    hits_null = (np.asarray(y_preds_null) == 1) & y_true_null
+
+    # Weight each track by the number of times it's drawn in each resample,
+    # and compute the mean recall of every resample at once
+    rng = np.random.RandomState(0)
+    n = len(y_true)
+    weights = np.vstack([np.ones(n), rng.multinomial(n, np.full(n, 1 / n), size=n_boot)])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        recall = (hits @ weights.T) / (y_true @ weights.T)
+        recall_null = (hits_null @ weights.T) / (y_true_null @ weights.T)
+    gaps = np.nan_to_num(recall).mean(axis=0) - np.nan_to_num(recall_null).mean(axis=0)
+
+    tail = (1 - level) / 2 * 100
+    return gaps[0], np.percentile(gaps[1:], [tail, 100 - tail])
+
+
+
+def pack_gaps(splits, results, results_baseline=None, permutation=None):
+    """Compute the recall gaps of an artist's models as compact arrays keyed by their .npz names.
+
+    With the full baseline, every model's real hold-out predictions are compared with its shuffled ones
+    (scored against the shuffled hold-out labels), and with the permutation baseline only the representative
+    models are, against their permutation predictions (scored against the real hold-out labels).
+    """
+    y_test, y_test_shuffled = splits[3], splits[5]
+    if permutation is None:
+        gap_models = range(len(results))
+        nulls = [(y_test_shuffled, final_scores(r, 'y_pred')) for r in results_baseline]
+    else:
+        gap_models = permutation['models']
+        nulls = [(y_test, y_preds) for y_preds in permutation['y_pred']]
+    gaps = [recall_gap(y_test, final_scores(results[n], 'y_pred'), *null) for n, null in zip(gap_models, nulls)]
+    return {'gap/models':np.asarray(gap_models, dtype=np.int32),
+            'gap/gap':np.array([g for g, ci in gaps], dtype=np.float32),
+            'gap/ci':np.array([ci for g, ci in gaps], dtype=np.float32).reshape(-1, 2)}
+
+
+
+def save_cv_store(save_path, save_name, splits, models, results, results_baseline=None, permutation=None):
+    """Save an artist's cross-validation results in the compact format.
+
+    save_path - the .npz file to write
+    save_name - the name of the results (stored in the metadata)
+    splits - the splits from split_df() (the dataframes are stored as row indices)
+    models - the list of models that were tested
+    results - the list of results dictionaries for the real labels (one per model)
+    results_baseline - the list of results dictionaries for the shuffled labels (one per model),
+                       or None when using the permutation baseline
+    permutation - the permutation baseline, as a dictionary of the positions of the representative
+                  models ('models'), and their hold-out scores ('holdout_score', of shape (models,
+                  permutations)) and predictions ('y_pred') on each permutation, from run_permutation_baseline()
+    """
+    meta = {'save_name':save_name,
+            'key_order':KEY_ORDER,
+            'columns':list(splits[0].columns),
+            'baseline':'shuffled' if permutation is None else 'permutation',
+            'models':[model_description(m) for m in models]}
+    arrays = {'meta':np.array(json.dumps(meta))}
+
+    # Store the splits as row indices into the dataset, and the labels as int8
+    arrays['split/X_train'] = np.asarray(splits[0].index, dtype=np.int32)
+    arrays['split/X_test'] = np.asarray(splits[1].index, dtype=np.int32)
+    for name, y in zip(SPLIT_NAMES[2:], splits[2:]):
+        arrays['split/' + name] = np.asarray(y, dtype=np.int8)
+
+    # Store the results for every model and label set
+    for label_set, res_list in zip(LABEL_SETS, [results, results_baseline]):
+        for n, r in enumerate(res_list or []):
+            arrays.update(pack_results(label_set, n, r))
+
+    # Store the permutation baseline, and the gap between the real and shuffled recall
+    if permutation is not None:
+        arrays['permutation/models'] = np.asarray(permutation['models'], dtype=np.int32)
+        arrays['permutation/holdout_score'] = np.asarray(permutation['holdout_score'], dtype=np.float32)
+        arrays['permutation/y_pred'] = np.asarray(permutation['y_pred'], dtype=np.int8)
+    arrays.update(pack_gaps(splits, results, results_baseline, permutation))
+
+    # Write to a temporary file first so an interrupted save never leaves a partial file
+    tmp_path = save_path + '.tmp.npz'
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, save_path)
+
+
+
+class CVResults:
+    """Lazy reader for an artist's compact cross-validation results.
+
+    Nothing but the metadata is read when it is opened; each array is only
+    decompressed when a model, metric, or split that needs it is requested.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._npz = np.load(path)
+        self.meta = json.loads(str(self._npz['meta']))
+        self.models = self.meta['models']
+
+    def close(self):
+        self._npz.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def model_results(self, n, label_set='real', keys=KEY_ORDER):
+        """Return the results dictionary of one model (y_pred and y_pred_proba as lists of per-fold arrays).
+
+        n - the position of the model in the list of models
+        label_set - 'real' or 'baseline' (shuffled labels, unless the permutation baseline was used)
+        keys - the result keys to load (any of KEY_ORDER, plus EXTRA_KEYS if they were saved)
+        """
+        prefix = '{}/{}/'.format(label_set, n)
+        r = {}
+        for key in keys:
+            if key == 'y_pred':
+                r[key] = list(self._npz[prefix + key])
+            elif key == 'y_pred_proba':
+                if prefix + key in self._npz.files:
+                    r[key] = list(self._npz[prefix + key])
+                else:
+                    r[key] = [None] * len(self._npz[prefix + 'fit_time'])
+            else:
+                r[key] = self._npz[prefix + key]
+        return r
+
+    def results(self, label_set='real', keys=KEY_ORDER):
+        """Return the list of results dictionaries for every model."""
+        return [self.model_results(n, label_set, keys) for n in range(len(self.models))]
+
+    def metric(self, key, label_set='real'):
+        """Return one metric for every model and fold as an array of shape (models, folds).
+
+        Successive halving results have a different number of fits for each model,
+        so they are returned as a list of arrays (one per model) instead.
+        """
+        arrays = [self._npz['{}/{}/{}'.format(label_set, n, key)] for n in range(len(self.models))]
+        if len({len(a) for a in arrays}) > 1:
+            return arrays
+        return np.stack(arrays)
+
+    def permutation(self):
+        """Return the permutation baseline (the representative models and their scores), or None if it wasn't used."""
+        if 'permutation/models' not in self._npz.files:
+            return None
+        return {key:self._npz['permutation/' + key] for key in ['models', 'holdout_score', 'y_pred']}
+
+    def gaps(self):
+        """Return the recall gaps between the real and shuffled labels ('models', 'gap', and 'ci'), or None for older files."""
+        if 'gap/models' not in self._npz.files:
+            return None
+        return {key:self._npz['gap/' + key] for key in ['models', 'gap', 'ci']}
+
+    def split_indices(self):
+        """Return the train and test row indices into the artist's dataset."""
+        return self._npz['split/X_train'], self._npz['split/X_test']
+
+    def splits(self, input_df):
+        """Rebuild the splits in the split_df() format from the artist's track dataframe.
+
+        Raises a ValueError if the rebuilt feature columns don't match the ones the results were saved with.
+        """
+        # Imported here, since model_tools imports this module
+        from model_tools import drop_cols
+        X = drop_cols(input_df).drop(['Track_Popularity'], axis=1)
+        if 'columns' in self.meta and list(X.columns) != self.meta['columns']:
+            raise ValueError('The dataframe has different feature columns than the saved splits')
+        train_idx, test_idx = self.split_indices()
+        splits = [X.loc[train_idx], X.loc[test_idx]]
+        splits.extend([self._npz['split/' + name].astype(np.int64) for name in SPLIT_NAMES[2:]])
+        return tuple(splits)
+
+
+
+def load_cv_results(i_file, model=None, label_set='real', keys=KEY_ORDER, data_dir='Data'):
+    """Load the cross-validation results for an artist, reading only what is asked for.
+
+    i_file - the file number of the artist
+    model - the position of a single model to load, or None for every model
+    label_set - 'real' or 'baseline' (shuffled labels)
+    keys - the result keys to load
+    """
+    with CVResults(cv_results_path(i_file, data_dir)) as cvr:
+        if model is None:
+            return cvr.results(label_set, keys)
+        return cvr.model_results(model, label_set, keys)
+
+
+
+def load_cv_metric(i_file, key, label_set='real', data_dir='Data'):
+    """Load one metric (e.g. 'holdout_score') for every model and fold of an artist, as a (models, folds) array."""
+    with CVResults(cv_results_path(i_file, data_dir)) as cvr:
+        return cvr.metric(key, label_set)
+
+
+
+def load_cv_gaps(i_file, data_dir='Data'):
+    """Load the real-vs-shuffled recall gaps of an artist's models (with their confidence intervals)."""
+    with CVResults(cv_results_path(i_file, data_dir)) as cvr:
+        return cvr.gaps()
+
+
+
+def convert_cv_pickle(i_file, data_dir='Data'):
+    """Convert an artist's original cv_results_artist_#.pkl file to the compact format."""
+    with open(os.path.join(data_dir, 'cv_results_artist_{}.pkl'.format(i_file)), 'rb') as f:
+        save_name, splits, models, results, results_baseline = pickle.load(f)
+    save_cv_store(cv_results_path(i_file, data_dir), save_name, splits, models, results, results_baseline)
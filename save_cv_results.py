@@ -1,12 +1,50 @@
 """Run cross-validation on example data for a series of different models,
-and save relevant results from each model for further evaluation."""
+and save relevant results from each model for further evaluation.
+
+Every (artist, model path, label set) cell is run on a pool of processes, a few artists at a time,
+and each artist's results are saved once all of its cells are done. Random forests that only
+differ in their number of trees are grown as one path, scoring the forest at each size, and
+logistic regressions are solved along increasing C, each starting from the last solution.
+Setting search_mode = 'halving' races the models with successive halving instead, within an
+optional compute budget per artist, still saving the hold-out predictions of every estimator fit.
+Setting baseline_mode = 'permutation' replaces the second search on shuffled labels with a few
+label permutations of the best model of each type, and both modes save the gap between the
+real and shuffled hold-out recall (with a bootstrap confidence interval over the hold-out
+tracks) for each model they compare.
+
+To split the work across several machines, run each shard with its shard id and the shard count
+(e.g. `python save_cv_results.py 0 4`), which saves its results to its own folder
+(e.g. Data/cv_results_shard_0_of_4), then combine the folders with merge_cv_shards()."""
 
 # Import spotify API tools and modeling functions
+import sys
 from spotify_tools import *
 from model_tools import *
+from results_tools import *
 
 # Set file numbers to process
 filerange = range(0, 201)
+data_dir = 'Data'
+shard = None
+
+# Number of artists whose cells are run on the pool together
+artists_per_block = 4
+
+# Fit the models that differ only in their warm-startable parameter (e.g. the number of trees)
+# as paths, growing each from the last instead of from scratch
+warm_start_paths = True
+
+# Search mode: 'grid' cross-validates every model on all of the data, and 'halving' races
+# the models with successive halving (see run_halving()), pruning the losers on subsamples
+search_mode = 'grid'
+# Seconds of fitting allowed for each artist in 'halving' mode, split evenly between
+# its label sets so the real and baseline races get the same share (None for no limit)
+halving_budget = None
+
+# Baseline mode: 'shuffled' runs the same search a second time on shuffled labels, and 'permutation'
+# only fits the best model of each type on n_permutations permutations of the labels (see run_permutation_baseline())
+baseline_mode = 'shuffled'
+n_permutations = 10
 
 # Set up model search parameters
 n_trees = [50, 100, 200]
@@ -14,89 +52,101 @@ n_depth = [2, 4, 6, 8, 10, 12]
 p_list = ['l1', 'l2']
 c_list = [.001, .1, 1, 10, 100]
 
-# Iterate over the files
-for i_file in filerange:
-    # Skip this file if it doesn't exist, open it otherwise
-    fpath = 'Data/data_artist_{}.pkl'.format(i_file)
-    if not os.path.exists(fpath):
-        continue
-    with open(fpath, 'rb') as f:
-        data = pickle.load(f)
-
-    # Exclude if the recommended tracks list was empty
-    if data[2][3]:
-        # Set the save path for the cross-validation results
-        save_name = 'cv_results_artist_{}.pkl'.format(i_file)
-        save_path = 'Data/{}'.format(save_name)
-
-        # Skip this file if it already exists
-        if os.path.exists(save_path):
-            print('Skipped: ', save_name)
+
+def run_block(block, all_models):
+    """Run every cell (path of models) of a block of artists on the process pool, then save each artist's results."""
+    # Test the models on the real data and the randomized data
+    # (each set of folds is preprocessed once here and shared by every model)
+    label_sets = ['real'] if baseline_mode == 'permutation' else ['real', 'baseline']
+    cells = []
+    grid = {}
+    all_folds = {}
+    for i_file, save_path, splits in block:
+        all_folds[i_file] = prep_folds(splits[0], splits[2], splits[1])
+        labels = {'real':(splits[2], splits[3], all_folds[i_file])}
+        if 'baseline' in label_sets:
+            labels['baseline'] = (splits[4], splits[5], prep_folds(splits[0], splits[4], splits[1]))
+
+        # Race the models one artist at a time (each rung runs on the process pool),
+        # within the artist's own budget
+        if search_mode == 'halving':
+            budget = None if halving_budget is None else halving_budget / len(label_sets)
+            for label_set in label_sets:
+                race = run_halving(all_models, *labels[label_set], budget=budget)
+                grid.update({(i_file, label_set, n):r for n, r in enumerate(race)})
+            continue
+
+        for path in model_paths(all_models, warm_start_paths):
+            models = [all_models[n] for n in path]
+            for label_set in label_sets:
+                y_train, y_test, folds = labels[label_set]
+                cells.append(([(i_file, label_set, n) for n in path], models, None, y_train, None, y_test, folds))
+    grid.update(run_cv_grid(cells))
+
+    # Save the results (in model order, whichever order the cells finished in)
+    for i_file, save_path, splits in block:
+        results = [grid[(i_file, 'real', n)] for n in range(len(all_models))]
+        if baseline_mode == 'permutation':
+            # Fit the best model of each type on permuted labels, reusing the real labels' folds
+            reps = representative_models(all_models, results)
+            scores, y_preds = run_permutation_baseline([all_models[n] for n in reps], splits[2], splits[3],
+                                                       all_folds[i_file], n_permutations)
+            results_baseline = None
+            permutation = {'models':reps, 'holdout_score':scores, 'y_pred':y_preds}
+        else:
+            results_baseline = [grid[(i_file, 'baseline', n)] for n in range(len(all_models))]
+            permutation = None
+        save_name = os.path.basename(save_path)
+        save_cv_store(save_path, save_name, splits, all_models, results, results_baseline, permutation)
+        if shard is not None:
+            complete_shard_item(data_dir, i_file)
+        print('Saved: ', save_name)
+
+
+
+if __name__ == '__main__':
+    # Only process one shard of the file numbers, if given a shard id and count
+    if len(sys.argv) > 2:
+        shard = (int(sys.argv[1]), int(sys.argv[2]))
+        data_dir = shard_dir('Data/cv_results', *shard)
+        filerange = start_shard(data_dir, 'cv_results', filerange, *shard)
+
+    # Set up the models to test
+    all_models = []
+    all_models.extend(make_RFC_list(n_trees, n_depth))
+    all_models.extend(make_LR_list(p_list, c_list))
+    all_models.extend(make_SVM_list(c_list))
+
+    # Iterate over the files
+    block = []
+    for i_file in filerange:
+        # Skip this artist if there's no data for it, load it otherwise
+        data = load_artist(i_file)
+        if data is None:
             continue
 
-        # Split the data into training and test sets
-        splits = split_df(data[2][5])
-
-        # Set up the models to test
-        all_models = []
-        all_models.extend(make_RFC_list(n_trees, n_depth))
-        all_models.extend(make_LR_list(p_list, c_list))
-        all_models.extend(make_SVC_list(c_list))
-
-        # Test the models on the real data and the randomized data
-        results = []
-        results_baseline = []
-        for model in all_models:
-            results.append(run_cv(model, splits[0], splits[2]))
-            results_baseline.append(run_cv(model, splits[0], splits[4]))
-
-        # Compute hold-out scores and delete estimators (to save space)
-        key_order = ['fit_time', 'score_time', 'train_score', 'test_score', 'holdout_score', 'y_pred', 'y_pred_proba']
-        for n, r in enumerate(results):
-            holdout_scores = []
-            y_preds = []
-            y_preds_proba = []
-            for est in r['estimator']:
-                y_pred = est.predict(splits[1])
-                y_preds.append(y_pred)
-                holdout = metrics.recall_score(splits[3], y_pred)
-                holdout_scores.append(holdout)
-                # Compute class probabilities if model is LR or RFC
-                if est['model'].__class__.__name__ in ['LogisticRegression', 'RandomForestClassifier']:
-                    y_pp = est.predict_proba(splits[1])
-                else:
-                    y_pp = None
-                y_preds_proba.append(y_pp)
-            r['holdout_score'] = np.array(holdout_scores)
-            r['y_pred'] = y_preds
-            r['y_pred_proba'] = y_preds_proba
-            del r['estimator']
-            # Reorder keys
-            results[n] = {k:r[k] for k in key_order}
-
-        for n, r in enumerate(results_baseline):
-            holdout_scores = []
-            y_preds = []
-            y_preds_proba = []
-            for est in r['estimator']:
-                y_pred = est.predict(splits[1])
-                y_preds.append(y_pred)
-                holdout = metrics.recall_score(splits[5], y_pred)
-                holdout_scores.append(holdout)
-                # Compute class probabilities if model is LR or RFC
-                if est['model'].__class__.__name__ in ['LogisticRegression', 'RandomForestClassifier']:
-                    y_pp = est.predict_proba(splits[1])
-                else:
-                    y_pp = None
-                y_preds_proba.append(y_pp)
-            r['holdout_score'] = np.array(holdout_scores)
-            r['y_pred'] = y_preds
-            r['y_pred_proba'] = y_preds_proba
-            del r['estimator']
-            # Reorder keys
-            results_baseline[n] = {k:r[k] for k in key_order}
-
-        # Save the results
-        with open(save_path, 'wb') as f:
-            pickle.dump([save_name, splits, all_models, results, results_baseline], f)
-        print('Saved: ', save_name)
\ No newline at end of file
+        # Exclude if the recommended tracks list was empty
+        if data[2][3]:
+            # Set the save path for the cross-validation results
+            save_path = cv_results_path(i_file, data_dir)
+            save_name = os.path.basename(save_path)
+
+            # Skip this file if it already exists
+            if os.path.exists(save_path):
+                if shard is not None:
+                    complete_shard_item(data_dir, i_file)
+                print('Skipped: ', save_name)
+                continue
+
+            # Split the data into training and test sets
+            splits = split_df(data[2][5])
+
+            # Run the cells once the block is full
+            block.append((i_file, save_path, splits))
+            if len(block) == artists_per_block:
+                run_block(block, all_models)
+                block = []
+
+    # Run whatever is left
+    if block:
+        run_block(block, all_models)
@@ -0,0 +1,193 @@
+"""Functions used for splitting dataset building and cross-validation runs into shards (e.g. across machines).
+
+Artist file numbers are assigned to shards round-robin (file number i goes to shard i % shard_count),
+so every shard gets the same share of the range whatever its order, and every file number belongs to
+exactly one shard. Each shard writes to its own folder, along with a shard_manifest.json recording
+which file numbers it was assigned and which it has finished, and the merge functions combine the
+shard folders once they're all done.
+
+Dataset shards also keep their own track store, artist graph, and response cache in their folder
+(see shard_stores()), so they never write to the global ones and can run on separate machines;
+merge_dataset_shards() combines their track stores and graphs into the global ones. Cross-validation
+shards only read the dataset store, and write their results to their own folders.
+"""
+
+
+# Import libraries
+import os
+import json
+import shutil
+import contextlib
+from store_tools import *
+from graph_tools import *
+from cache_tools import *
+
+
+# Name of the manifest written in each shard's folder
+SHARD_MANIFEST = 'shard_manifest.json'
+
+# Location of the manifest of the merged cross-validation results
+CV_MANIFEST_PATH = 'Data/cv_results_manifest.json'
+
+
+
+def shard_filerange(filerange, shard_id=0, shard_count=1):
+    """Return the file numbers of a range that belong to one shard.
+
+    filerange - the full range (or list) of file numbers being processed
+    shard_id - the number of the shard (from 0 to shard_count - 1)
+    shard_count - the total number of shards
+    """
+    if not 0 <= shard_id < shard_count:
+        raise ValueError('shard_id must be between 0 and {}'.format(shard_count - 1))
+    return [i for i in filerange if i % shard_count == shard_id]
+
+
+
+def shard_dir(base_dir, shard_id, shard_count):
+    """Return the folder a shard writes its output to (e.g. Data/store_shard_0_of_4)."""
+    return '{}_shard_{}_of_{}'.format(base_dir.rstrip('/'), shard_id, shard_count)
+
+
+
+def load_shard_manifest(path):
+    """Load the manifest of a shard folder (None if it doesn't have one)."""
+    fpath = os.path.join(path, SHARD_MANIFEST)
+    if not os.path.exists(fpath):
+        return None
+    with open(fpath, 'r') as f:
+        return json.load(f)
+
+
+
+def start_shard(path, kind, filerange, shard_id, shard_count):
+    """Create (or reopen) a shard folder and its manifest.
+
+    path - the shard's folder
+    kind - the type of output ('dataset' or 'cv_results')
+    filerange - the full range (or list) of file numbers being processed by all of the shards
+    shard_id - the number of the shard
+    shard_count - the total number of shards
+    Returns the file numbers assigned to the shard.
+    """
+    assigned = shard_filerange(filerange, shard_id, shard_count)
+    manifest = load_shard_manifest(path)
+    if manifest is not None and (manifest['kind'], manifest['shard_count']) != (kind, shard_count):
+        raise ValueError('{} already holds a different shard ({} shard of {})'.format(
+            path, manifest['kind'], manifest['shard_count']))
+    completed = [] if manifest is None else manifest['completed']
+    os.makedirs(path, exist_ok=True)
+    atomic_write_json({'kind':kind,
+                       'shard_id':shard_id,
+                       'shard_count':shard_count,
+                       'filerange':list(filerange),
+                       'assigned':assigned,
+                       'completed':completed}, os.path.join(path, SHARD_MANIFEST))
+    return assigned
+
+
+
+def complete_shard_item(path, i_file):
+    """Record a file number as finished in a shard's manifest."""
+    manifest = load_shard_manifest(path)
+    if i_file not in manifest['completed']:
+        manifest['completed'].append(i_file)
+        atomic_write_json(manifest, os.path.join(path, SHARD_MANIFEST))
+
+
+
+def check_shards(shard_dirs, kind):
+    """Check that a set of shard folders covers a whole range exactly once, and return their manifests.
+
+    Raises a ValueError if a shard is missing or doesn't match the others, and prints the
+    assigned file numbers any shard hasn't finished (e.g. artists without data are never finished).
+    """
+    manifests = []
+    for path in shard_dirs:
+        manifest = load_shard_manifest(path)
+        if manifest is None or manifest['kind'] != kind:
+            raise ValueError('{} is not a {} shard'.format(path, kind))
+        manifests.append(manifest)
+
+    # Every shard should be from the same split of the same range, with none missing or repeated
+    shard_count = manifests[0]['shard_count']
+    filerange = manifests[0]['filerange']
+    for manifest in manifests:
+        if manifest['shard_count'] != shard_count or manifest['filerange'] != filerange:
+            raise ValueError('The shards were not split from the same range')
+    ids = sorted(m['shard_id'] for m in manifests)
+    if ids != list(range(shard_count)):
+        missing = sorted(set(range(shard_count)).difference(ids))
+        raise ValueError('Missing or repeated shards (missing: {})'.format(missing))
+
+    # Report any assigned work that wasn't finished
+    for path, manifest in zip(shard_dirs, manifests):
+        unfinished = sorted(set(manifest['assigned']).difference(manifest['completed']))
+        if unfinished:
+            print('Unfinished in {}: {}'.format(path, unfinished))
+    return manifests
+
+
+
+@contextlib.contextmanager
+def shard_stores(path):
+    """Point the process-wide track store, artist graph, and response cache at a shard's folder while running a block.
+
+    path - the shard's folder (its track store is path/tracks, as for any dataset store)
+    """
+    previous = (get_track_store(), get_graph(), get_cache())
+    os.makedirs(path, exist_ok=True)
+    set_track_store(open_track_store(path))
+    set_graph(ArtistGraph(os.path.join(path, 'artist_graph.npz')))
+    set_cache(ResponseCache(os.path.join(path, 'api_cache.sqlite')))
+    try:
+        yield
+    finally:
+        set_track_store(previous[0])
+        set_graph(previous[1])
+        set_cache(previous[2])
+
+
+
+def merge_dataset_shards(shard_dirs, store_dir=STORE_DIR):
+    """Combine the dataset stores built by each shard of save_random_artist_data() into one store.
+
+    Tracks shared between shards are only stored once in the merged track store, and the
+    shards' artist graphs are merged into the global graph (the shards' response caches are
+    left in their folders).
+    """
+    manifests = check_shards(shard_dirs, 'dataset')
+    for path, manifest in zip(shard_dirs, manifests):
+        store_manifest = load_manifest(path)
+        for i_file in sorted(manifest['completed']):
+            data = load_artist_data(i_file, path, store_manifest)
+            append_artist(i_file, data, store_dir)
+            print('Merged: ', data[0])
+
+    # Merge the related artists crawled by each shard into the global graph
+    graph = get_graph()
+    if graph is not None:
+        for path in shard_dirs:
+            graph.merge(os.path.join(path, 'artist_graph.npz'))
+        graph.save()
+
+
+
+def merge_cv_shards(shard_dirs, data_dir='Data', manifest_path=CV_MANIFEST_PATH):
+    """Combine the cross-validation results saved by each shard of save_cv_results.py into one folder.
+
+    The results files are copied into data_dir, and a manifest of every artist's results file
+    (and the shard it came from) is saved to manifest_path.
+    """
+    manifests = check_shards(shard_dirs, 'cv_results')
+    results = {}
+    for path, manifest in zip(shard_dirs, manifests):
+        for i_file in sorted(manifest['completed']):
+            fname = 'cv_results_artist_{}.npz'.format(i_file)
+            shutil.copyfile(os.path.join(path, fname), os.path.join(data_dir, fname + '.tmp'))
+            os.replace(os.path.join(data_dir, fname + '.tmp'), os.path.join(data_dir, fname))
+            results[str(i_file)] = {'file':fname, 'shard_id':manifest['shard_id']}
+            print('Merged: ', fname)
+    atomic_write_json({'shard_count':manifests[0]['shard_count'],
+                       'filerange':manifests[0]['filerange'],
+                       'results':results}, manifest_path)
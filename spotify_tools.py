@@ -1,15 +1,36 @@
 """Functions used for interacting with data from the Spotify API."""
 
 
-# Set up Spotipy (Spotify API package)
+# Set up Spotipy (Spotify API package) through the shared client
 import os
+import numpy as np
 import pandas as pd
-import spotipy
-from spotipy.oauth2 import SpotifyClientCredentials
-from spotify_credentials import *
-os.environ["SPOTIPY_CLIENT_ID"] = client_id
-os.environ["SPOTIPY_CLIENT_SECRET"] = client_secret
+from client_tools import *
+from cache_tools import *
+from store_tools import *
+from graph_tools import *
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+# Default number of worker threads for concurrent API requests
+MAX_WORKERS = 8
+
+# Columns of the track dataframe, in order (the audio features are keyed by their API field names)
+TRACK_OBJECT_COLS = ['Track_Name', 'Track_ID', 'Track_Artists', 'Track_Album_Name', 'Track_Album_ID']
+TRACK_INT_COLS = ['Track_Popularity', 'Track_Explicitness', 'Track_Duration']
+TRACK_FEATURE_COLS = {'key':'Track_Key',
+                      'mode':'Track_Mode',
+                      'time_signature':'Track_TimeSig',
+                      'acousticness':'Track_Acousticness',
+                      'danceability':'Track_Danceability',
+                      'energy':'Track_Energy',
+                      'instrumentalness':'Track_Instrumentalness',
+                      'liveness':'Track_Liveness',
+                      'loudness':'Track_Loudness',
+                      'speechiness':'Track_Speechiness',
+                      'valence':'Track_Valence',
+                      'tempo':'Track_Tempo'}
 
 
 
@@ -29,10 +50,71 @@ def chunks(input_list, n):
 
 
 
+def fetch_concurrent(func, input_list, max_workers=MAX_WORKERS):
+    """Call a function on every item of a list from a pool of threads, yielding (item, result) pairs as they finish.
+
+    func - the function to call (e.g. a single API request)
+    input_list - the items to call the function on
+    max_workers - the maximum number of calls in flight at once (1 runs them serially, in order)
+    """
+    # Run serially without the overhead of a pool
+    if max_workers <= 1:
+        for item in input_list:
+            yield item, func(item)
+        return
+
+    # Keep at most max_workers calls in flight, submitting a new one as each finishes
+    items = iter(input_list)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending = {}
+        for item in items:
+            pending[pool.submit(func, item)] = item
+            if len(pending) >= max_workers:
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                yield item, future.result()
+                for new_item in items:
+                    pending[pool.submit(func, new_item)] = new_item
+                    break
+
+
+
+def cached_lookup(endpoint, id_list, fetch, chunk_size=1, max_workers=1):
+    """Look up API objects by id, only calling the API for the ones missing from the response cache.
+
+    endpoint - the cache namespace for the objects (e.g. 'artists')
+    id_list - the list of ids to look up
+    fetch - function taking a chunk of ids and returning the matching API objects in the same order
+    chunk_size - the maximum number of ids the API endpoint accepts per call
+    max_workers - the number of chunks to fetch concurrently
+    """
+    # Pull whatever is already cached
+    cache = get_cache()
+    if cache is not None:
+        found = cache.get_many(endpoint, id_list)
+    else:
+        found = {}
+
+    # Fetch the rest from the API in chunks and add them to the cache
+    missing = [x for x in dict.fromkeys(id_list) if x not in found]
+    for chunk, objs in fetch_concurrent(fetch, list(chunks(missing, chunk_size)), max_workers):
+        fetched = dict(zip(chunk, objs))
+        found.update(fetched)
+        if cache is not None:
+            cache.put_many(endpoint, fetched)
+
+    # Return the objects in the order requested
+    return [found[x] for x in id_list]
+
+
+
 def search_spotify(query):
     """Find artist name, id, and image from a search query."""
-    # Set credentials and run the query
-    sp = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials())
+    # Get the shared client and run the query
+    sp = get_client()
     results = sp.search(q=query, type='artist')
     
     # Return the results as a tuple
@@ -42,8 +124,8 @@ def search_spotify(query):
 
 def get_random_artists():
     """Generate a list of random artists."""
-    # Set credentials
-    sp = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials())
+    # Get the shared client
+    sp = get_client()
 
     # Pull 2000 artsits randomly from spotify's catalog
     random_artists = []
@@ -59,8 +141,8 @@ def get_random_artists():
 
 def playlist_df(playlist_id):
     """Given a playlist id, put relevant info into a dataframe."""
-    # Set credentials and get playlist
-    sp = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials())
+    # Get the shared client and the playlist
+    sp = get_client()
     pl = sp.playlist(playlist_id)
     
     # Pull out the relevant playlist information
@@ -88,23 +170,22 @@ def artist_df(artist_id_list):
     if not isinstance(artist_id_list, list):
         artist_id_list = [artist_id_list]
         
-    # Set credentials
-    sp = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials())
+    # Get the shared client
+    sp = get_client()
     art_df_list = []
 
     # Break the list into chunks of 50 and iterate over them
-    chunked = list(chunks(artist_id_list, 50))
-    for chunk in chunked:
-        arts = sp.artists(chunk)
-
-        # Pull out the relevant artist information
-        for art in arts['artists']:
-            art_dict = {'Artist_Name':art['name'],
-                        'Artist_ID':art['id'],
-                        'Artist_Genres':df_listcell(art['genres']),
-                        'Artist_Followers':art['followers']['total'],
-                        'Artist_Popularity':art['popularity']}
-            art_df_list.append(art_dict)
+    # (only the artists missing from the response cache are requested)
+    arts = cached_lookup('artists', artist_id_list, lambda chunk: sp.artists(chunk)['artists'], 50)
+
+    # Pull out the relevant artist information
+    for art in arts:
+        art_dict = {'Artist_Name':art['name'],
+                    'Artist_ID':art['id'],
+                    'Artist_Genres':df_listcell(art['genres']),
+                    'Artist_Followers':art['followers']['total'],
+                    'Artist_Popularity':art['popularity']}
+        art_df_list.append(art_dict)
     
     # Put results into a dataframe
     art_df = pd.DataFrame(art_df_list)
@@ -118,26 +199,25 @@ def album_df(album_id_list):
     if not isinstance(album_id_list, list):
         album_id_list = [album_id_list]
     
-    # Set credentials
-    sp = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials())
+    # Get the shared client
+    sp = get_client()
     alb_df_list = []
 
     # Break the list into chunks of 20 and iterate over them
-    chunked = list(chunks(album_id_list, 20))
-    for chunk in chunked:
-        albs = sp.albums(chunk)
-    
-        # Pull out the relevant album information
-        for alb in albs['albums']:
-            alb_dict = {'Album_Name':alb['name'],
-                        'Album_ID':alb['id'],
-                        'Album_Type':alb['album_type'],
-                        'Album_Artists':df_listcell([x['id'] for x in alb['artists']]),
-                        'Album_Genres':df_listcell(alb['genres']),
-                        'Album_Popularity':alb['popularity'],
-                        'Album_Label':alb['label'],
-                        'Album_Release_Date':alb['release_date']}
-            alb_df_list.append(alb_dict)
+    # (only the albums missing from the response cache are requested)
+    albs = cached_lookup('albums', album_id_list, lambda chunk: sp.albums(chunk)['albums'], 20)
+
+    # Pull out the relevant album information
+    for alb in albs:
+        alb_dict = {'Album_Name':alb['name'],
+                    'Album_ID':alb['id'],
+                    'Album_Type':alb['album_type'],
+                    'Album_Artists':df_listcell([x['id'] for x in alb['artists']]),
+                    'Album_Genres':df_listcell(alb['genres']),
+                    'Album_Popularity':alb['popularity'],
+                    'Album_Label':alb['label'],
+                    'Album_Release_Date':alb['release_date']}
+        alb_df_list.append(alb_dict)
     
     # Put results into a dataframe
     alb_df = pd.DataFrame(alb_df_list)
@@ -145,229 +225,352 @@ def album_df(album_id_list):
 
 
 
-def track_df(track_id_list):
-    """Given a list of track ids, put relevant info into a dataframe (including audio features)."""
+def track_df(track_id_list, max_workers=MAX_WORKERS):
+    """Given a list of track ids, put relevant info into a dataframe (including audio features).
+
+    Tracks already in the global track store are read from it (only their popularity scores are
+    requested again, once they're older than the store's popularity_ttl), and the rest are
+    pulled from the API and added to it.
+
+    track_id_list - the list of track ids
+    max_workers - the number of chunks of tracks and audio features to request concurrently
+    """
     # Check if the input is not already a list
     if not isinstance(track_id_list, list):
         track_id_list = [track_id_list]
-        
-    # Set credentials
-    sp = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials())
-    trk_df_list = []
-    trk_feat_df_list = []
+
+    # Pull everything from the API if the track store is turned off
+    store = get_track_store()
+    if store is None:
+        return fetch_track_df(track_id_list, max_workers)
+
+    # Refresh the stale popularity scores of the stored tracks (leaving out any no longer available)
+    known = store.lookup(track_id_list)
+    stale = [x for x, s in zip(known, store.stale(list(known.values()))) if s]
+    if stale:
+        popularity = track_popularity(stale, max_workers)
+        for x in stale:
+            if x not in popularity:
+                del known[x]
+
+    # Pull the new tracks and add them to the store
+    new_ids = [x for x in dict.fromkeys(track_id_list) if x not in known]
+    if new_ids:
+        new_df = fetch_track_df(new_ids, max_workers)
+        known.update(zip(new_df['Track_ID'], store.add(new_df)))
+
+    # Build the dataframe from the store (in the order of the input list)
+    rows = [known[x] for x in track_id_list if x in known]
+    return store.frame(rows)
+
+
+
+def fetch_track_df(track_id_list, max_workers=MAX_WORKERS):
+    """Pull the info and audio features for a list of track ids from the API into a dataframe.
+
+    track_id_list - the list of track ids
+    max_workers - the number of chunks of tracks and audio features to request concurrently
+    """
+    # Get the shared client
+    sp = get_client()
     
-    # Break the list into chunks of 50 and iterate over them
-    chunked = list(chunks(track_id_list, 50))
-    for chunk in chunked:
-        trks = sp.tracks(chunk)
-        trks_feat = sp.audio_features(chunk)
-
-        # Pull out the relevant track information    
-        for trk in trks['tracks']:
-            trk_dict = {'Track_Name':trk['name'],
-                        'Track_ID':trk['id'],
-                        'Track_Artists':df_listcell([x['id'] for x in trk['artists']]),
-                        'Track_Album_Name':trk['album']['name'],
-                        'Track_Album_ID':trk['album']['id'],
-                        'Track_Popularity':trk['popularity'],
-                        'Track_Explicitness':int(trk['explicit'] == True),
-                        'Track_Duration':trk['duration_ms']}
-            trk_df_list.append(trk_dict)
-
-        # Pull out the relevant track feature information
-        for trk_feat in trks_feat:
-            if trk_feat is None:
-                trk_feat_dict = {'Track_Key':None,
-                                 'Track_Mode':None,
-                                 'Track_TimeSig':None,
-                                 'Track_Acousticness':None,
-                                 'Track_Danceability':None,
-                                 'Track_Energy':None,
-                                 'Track_Instrumentalness':None,
-                                 'Track_Liveness':None,
-                                 'Track_Loudness':None,
-                                 'Track_Speechiness':None,
-                                 'Track_Valence':None,
-                                 'Track_Tempo':None}
-            else:
-                trk_feat_dict = {'Track_Key':trk_feat['key'],
-                                 'Track_Mode':trk_feat['mode'],
-                                 'Track_TimeSig':trk_feat['time_signature'],
-                                 'Track_Acousticness':trk_feat['acousticness'],
-                                 'Track_Danceability':trk_feat['danceability'],
-                                 'Track_Energy':trk_feat['energy'],
-                                 'Track_Instrumentalness':trk_feat['instrumentalness'],
-                                 'Track_Liveness':trk_feat['liveness'],
-                                 'Track_Loudness':trk_feat['loudness'],
-                                 'Track_Speechiness':trk_feat['speechiness'],
-                                 'Track_Valence':trk_feat['valence'],
-                                 'Track_Tempo':trk_feat['tempo']}
-            trk_feat_df_list.append(trk_feat_dict)
+    # Break the list into chunks of 50 and get the tracks and audio features at the same time
+    # (the chunks are requested in parallel, and only the ones missing from the response cache)
+    fetchers = {'tracks':lambda chunk: sp.tracks(chunk)['tracks'],
+                'audio_features':sp.audio_features}
+    lookup = lambda endpoint: cached_lookup(endpoint, track_id_list, fetchers[endpoint], 50, max_workers)
+    results = dict(fetch_concurrent(lookup, list(fetchers), 2))
+    trks = results['tracks']
+    trks_feat = results['audio_features']
+
+    # Preallocate the columns
+    n = len(trks)
+    track_cols = {col:np.empty(n, dtype=object) for col in TRACK_OBJECT_COLS}
+    track_cols.update({col:np.zeros(n, dtype=np.int64) for col in TRACK_INT_COLS})
+    feat_cols = {col:np.full(n, np.nan) for col in TRACK_FEATURE_COLS.values()}
+    has_feat = np.zeros(n, dtype=bool)
+
+    # Pull out the relevant track information
+    for i, trk in enumerate(trks):
+        track_cols['Track_Name'][i] = trk['name']
+        track_cols['Track_ID'][i] = trk['id']
+        track_cols['Track_Artists'][i] = [x['id'] for x in trk['artists']]
+        track_cols['Track_Album_Name'][i] = trk['album']['name']
+        track_cols['Track_Album_ID'][i] = trk['album']['id']
+        track_cols['Track_Popularity'][i] = trk['popularity']
+        track_cols['Track_Explicitness'][i] = int(trk['explicit'] == True)
+        track_cols['Track_Duration'][i] = trk['duration_ms']
+
+    # Pull out the relevant track feature information (left as NaN if there isn't any)
+    for i, trk_feat in enumerate(trks_feat):
+        if trk_feat is not None:
+            has_feat[i] = True
+            for key, col in TRACK_FEATURE_COLS.items():
+                feat_cols[col][i] = trk_feat[key]
 
-    # Put results into a dataframe
-    trk_df = pd.DataFrame(trk_df_list).join(pd.DataFrame(trk_feat_df_list))
     # Drop rows without audio feature data
-    if 'Track_Key' in trk_df.columns:
-        trk_df = trk_df[trk_df['Track_Key'].notna()].reset_index(drop=True)
+    all_feat = has_feat.all()
+    if not all_feat:
+        track_cols = {col:vals[has_feat] for col, vals in track_cols.items()}
+        feat_cols = {col:vals[has_feat] for col, vals in feat_cols.items()}
+    # The integer-valued features are only stored as integers if no rows were missing them
+    elif n:
+        for col in ['Track_Key', 'Track_Mode', 'Track_TimeSig']:
+            feat_cols[col] = feat_cols[col].astype(np.int64)
+
+    # Put results into a dataframe
+    trk_df = pd.DataFrame({**track_cols, **feat_cols})
     return trk_df
 
 
 
+def track_popularity(track_id_list, max_workers=MAX_WORKERS):
+    """Given a list of track ids, return a dictionary of their current popularity scores.
+
+    The tracks are always requested from the API (bypassing the response cache and the track store,
+    which are both refreshed along the way), and tracks that are no longer available are left out.
+
+    track_id_list - the list of track ids
+    max_workers - the number of chunks of 50 tracks to request concurrently
+    """
+    # Get the shared client
+    sp = get_client()
+    cache = get_cache()
+
+    # Request the tracks in parallel chunks of 50
+    popularity = {}
+    fetch = lambda chunk: sp.tracks(chunk)['tracks']
+    for chunk, trks in fetch_concurrent(fetch, list(chunks(track_id_list, 50)), max_workers):
+        fetched = {x:trk for x, trk in zip(chunk, trks) if trk is not None}
+        popularity.update({x:trk['popularity'] for x, trk in fetched.items()})
+        if cache is not None:
+            cache.put_many('tracks', fetched)
+
+    # Keep the track store's popularity scores up to date too
+    store = get_track_store()
+    if store is not None:
+        store.set_popularity(popularity)
+    return popularity
+
+
+
+def artist_album_items(artist_id, album_types=['album', 'single', 'compilation'], max_workers=MAX_WORKERS):
+    """Given an artist id, return the (simplified) album objects of the chosen album types as a list.
+
+    artist_id - the Spotify ID of the artist
+    album_types - the album types to include, in order
+    max_workers - the number of album types to request concurrently
+    """
+    # Get the shared client
+    sp = get_client()
+
+    def fetch(typ):
+        # Get the albums of this type from the API and go through pagination
+        art_alb = sp.artist_albums(artist_id, album_type=typ, limit=50)
+        items = art_alb['items']
+        while art_alb['next']:
+            art_alb = sp.next(art_alb)
+            items.extend(art_alb['items'])
+        return items
+
+    # Request the album types concurrently, then put them back in order
+    results = dict(fetch_concurrent(fetch, album_types, max_workers))
+    return [x for typ in album_types for x in results[typ]]
+
+
+
 def artist_albumlist(artist_id):
     """Given an artist id, return the id of all albums as a list."""
-    # Set credentials
-    sp = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials())
-    
     # Loop through album types and get info from API
     album_types = ['album', 'single', 'compilation'] # exclude 'appears_on'
-    results = []
-    for typ in album_types:
-        art_alb = sp.artist_albums(artist_id, album_type=typ, limit=50)
-    
-        # Put album name and id into a list and go through pagination
-        results.extend([(x['name'], x['id']) for x in art_alb['items']])
-        while art_alb['next']:
-            art_alb = sp.next(art_alb)
-            results.extend([(x['name'], x['id']) for x in art_alb['items']])
+    results = [(x['name'], x['id']) for x in artist_album_items(artist_id, album_types)]
     return results
 
 
 
+def album_track_items(album_id_list, max_workers=MAX_WORKERS):
+    """Given a list of album ids, return the tracks of each album as a list of (trimmed) track objects.
+
+    Albums are pulled 20 at a time from the multi-album endpoint, which includes the first page
+    of tracks, so only albums with more than one page of tracks need further requests.
+    Only the name, id, and artists of each track are kept, which keeps the response cache small.
+
+    album_id_list - the list of album ids
+    max_workers - the number of requests to run concurrently
+    """
+    # Get the shared client
+    sp = get_client()
+
+    def fetch_page(page):
+        # Get a single page of album tracks from the API
+        album, offset = page
+        return sp.album_tracks(album, limit=50, offset=offset)['items']
+
+    def fetch(chunk):
+        # Get up to 20 albums (with their first page of tracks) from the API
+        # (unavailable or unknown albums come back as None, and are given no tracks)
+        albs = sp.albums(chunk)['albums']
+        items = {album:{0:[] if alb is None else alb['tracks']['items']} for album, alb in zip(chunk, albs)}
+
+        # Request the rest of the pages of the longer albums concurrently
+        pages = []
+        for album, alb in zip(chunk, albs):
+            if alb is not None and alb['tracks']['next']:
+                trks = alb['tracks']
+                pages.extend([(album, offset) for offset in range(trks['limit'], trks['total'], 50)])
+        for (album, offset), page in fetch_concurrent(fetch_page, pages, max_workers):
+            items[album][offset] = page
+
+        # Put the pages back in order
+        results = []
+        for album in chunk:
+            results.append([trim_track_item(x) for offset in sorted(items[album]) for x in items[album][offset]])
+        return results
+
+    # Only the albums missing from the response cache are requested
+    return cached_lookup('album_tracks', album_id_list, fetch, 20, max_workers)
+
+
+
+def trim_track_item(trk):
+    """Keep only the name, id, and artists (names and ids) of a track object."""
+    return {'name':trk['name'],
+            'id':trk['id'],
+            'artists':[{'name':a['name'], 'id':a['id']} for a in trk['artists']]}
+
+
+
 def album_tracklist(album_id):
     """Given an album id, return the id of all tracks as a list."""
-    # Set credentials and get info from API
-    sp = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials())
-    alb_trk = sp.album_tracks(album_id, limit=50)
+    # Get the album tracks (from the cache or the API)
+    items = album_track_items([album_id])[0]
     
-    # Put results into a list and go through pagination
-    results = [(x['name'], x['id']) for x in alb_trk['items']]
-    while alb_trk['next']:
-        alb_trk = sp.next(alb_trk)
-        results.extend([(x['name'], x['id']) for x in alb_trk['items']])
+    # Put results into a list
+    results = [(x['name'], x['id']) for x in items]
     return results
 
 
 
 def artist_tracklist(artist_id):
-    """Given an artist id, return the id of all tracks as a list.
-
-    Calling artist_albumlist() followed by album_tracklist() would unnecessarily
-    reset the credentials over and over again, rather than just once here.
-    """
-    # Set credentials
-    sp = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials())
-
+    """Given an artist id, return the id of all tracks as a list."""
     # Loop through album types and get artist's albums from API
     album_types = ['album', 'single', 'compilation'] # exclude 'appears_on'
-    albumlist = []
-    for typ in album_types:
-        art_alb = sp.artist_albums(artist_id, album_type=typ, limit=50)
+    albumlist = [x['id'] for x in artist_album_items(artist_id, album_types)]
     
-        # Put data into a list and go through pagination
-        albumlist.extend([x['id'] for x in art_alb['items']])
-        while art_alb['next']:
-            art_alb = sp.next(art_alb)
-            albumlist.extend([x['id'] for x in art_alb['items']])    
-    
-    # Pull the tracks for each album one-by-one
+    # Pull the tracks for each album in bulk (from the cache or the API)
     tracklist = []
-    for album in albumlist:
-        # Get album tracks from API
-        alb_trk = sp.album_tracks(album, limit=50)
-        
-        # Put results into a list and go through pagination
-        tracklist.extend([(x['name'], x['id']) for x in alb_trk['items']])
-        while alb_trk['next']:
-            alb_trk = sp.next(alb_trk)
-            tracklist.extend([(x['name'], x['id']) for x in alb_trk['items']])
+    for items in album_track_items(albumlist):
+        tracklist.extend([(x['name'], x['id']) for x in items])
     return tracklist
 
 
 
-def related_artists_network(artist_id, degrees=0):
+def related_artists_network(artist_id, degrees=0, max_workers=MAX_WORKERS, return_info=False):
     """Given an artist id, return the id of all 20 related artists in a list, and their related artists in turn.
 
+    The network is read from the persistent artist graph, and only artists that are missing from
+    it (or were crawled longer ago than its ttl) are requested from the API and added to it.
+
     artist_id - the Spotify ID of the seed artist
     degrees - the number of degrees out in the related artists network to search
+    max_workers - the number of artists in each degree of the network to request concurrently
+    return_info - if True, also return a dictionary of the artist objects seen during the crawl (keyed by id)
     """
-    # Set credentials
-    sp = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials())
+    # Get the shared client and the artist graph
+    sp = get_client()
+    graph = get_graph()
+    fetch = lambda chunk: [sp.artist_related_artists(x)['artists'] for x in chunk]
     
     # Iterate over the artists for the number of degrees set (without retreading duplicates)
     unchecked = [artist_id] # id values which haven't been checked yet
     checked = [] # id values which have been checked
     artist_list = [] # passes intermediate results around and stores the final result
+    artist_info = {} # artist objects from the related artists payloads (name, followers, etc.)
+    updated = False
     while degrees > 0:
-        for art in unchecked:
-            related_artists = sp.artist_related_artists(art)
-            related_ids = [x['id'] for x in related_artists['artists']]
+        if graph is None:
+            # Get the related artists of this whole degree in parallel
+            # (only the ones missing from the cache are requested)
+            related = cached_lookup('related_artists', unchecked, fetch, max_workers=max_workers)
+            for related_artists in related:
+                artist_info.update({x['id']:x for x in related_artists})
+            related_ids = [[x['id'] for x in related_artists] for related_artists in related]
+        else:
+            # Only crawl the artists of this degree that are stale or missing from the graph
+            stale = graph.stale(unchecked)
+            if stale:
+                related = cached_lookup('related_artists', stale, fetch, max_workers=max_workers)
+                graph.update(dict(zip(stale, related)))
+                updated = True
+            related_ids = [graph.related(art) for art in unchecked]
+        for art, ids in zip(unchecked, related_ids):
             checked.append(art)
-            artist_list.extend(related_ids)
+            artist_list.extend(ids)
         unchecked = list(set(artist_list).difference(checked))
         degrees -= 1
     artist_list = list(set(checked).union(unchecked))
+
+    # Save any newly crawled artists, and look up the artist objects in the graph
+    if graph is not None:
+        if updated:
+            graph.save()
+        artist_info = graph.artist_info(artist_list)
+    if return_info:
+        return artist_list, artist_info
     return artist_list
 
 
 
-def recommended_tracks(artist_id_list, pop_list=range(5, 100, 30)):
+def recommended_tracks(artist_id_list, pop_list=range(5, 100, 30), max_workers=MAX_WORKERS, by_artist=False):
     """Get a list of similar tracks based on a seed list o artists, distributed across popularity scores.
 
     artist_id_list - the list of artists with which to seed track recommendations
     pop_list - the target popularity scores for getting track recommendations
+    max_workers - the maximum number of recommendation requests in flight at once
+    by_artist - if True, return a dictionary of each artist's recommended tracks (keyed by artist id) instead
     """
     # Check if the input is not already a list
     if not isinstance(artist_id_list, list):
         artist_id_list = [artist_id_list]
     
-    # Set credentials
-    sp = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials())
+    # Get the shared client
+    sp = get_client()
     
-    # Generate a list of similar tracks for each artist, balanced by popularity score (if applicable)
-    tracklist = []
-    for art in artist_id_list:
-        if pop_list:
-            for pop in pop_list:
-                recs = sp.recommendations(seed_artists=[art], limit=100, target_popularity=pop)
-                tracklist.extend([x['id'] for x in recs['tracks']])
-        else:
-            recs = sp.recommendations(seed_artists=[art], limit=100)
-            tracklist.extend([x['id'] for x in recs['tracks']])            
-
-    # Remove duplicate tracks and return the list
-    tracklist = list(set(tracklist))
+    # Set up one request per artist, balanced by popularity score (if applicable)
+    if pop_list:
+        rec_requests = [(art, pop) for art in artist_id_list for pop in pop_list]
+    else:
+        rec_requests = [(art, None) for art in artist_id_list]
+
+    def fetch(request):
+        art, pop = request
+        if pop is None:
+            return sp.recommendations(seed_artists=[art], limit=100)
+        return sp.recommendations(seed_artists=[art], limit=100, target_popularity=pop)
+
+    # Run the requests concurrently, adding the similar tracks to each artist's set (removing duplicates) as they arrive
+    tracksets = {art:set() for art in artist_id_list}
+    for (art, pop), recs in fetch_concurrent(fetch, rec_requests, max_workers):
+        tracksets[art].update([x['id'] for x in recs['tracks']])
+    if by_artist:
+        return {art:sorted(tracks) for art, tracks in tracksets.items()}
+
+    # Return the list
+    tracklist = list(set().union(*tracksets.values()))
     return tracklist
 
 
 
 def get_collabs(artist_id):
     """Get a list of collaborators for an artist id, based on who that artist has worked with in the past."""
-    # Set credentials
-    sp = spotipy.Spotify(client_credentials_manager=SpotifyClientCredentials())
-
     # Loop through album types and get artist's albums from API
     album_types = ['album', 'single', 'compilation', 'appears_on']
-    albumlist = []
-    for typ in album_types:
-        art_alb = sp.artist_albums(artist_id, album_type=typ, limit=50)
+    albumlist = [x['id'] for x in artist_album_items(artist_id, album_types)]
     
-        # Put data into a list and go through pagination
-        albumlist.extend([x['id'] for x in art_alb['items']])
-        while art_alb['next']:
-            art_alb = sp.next(art_alb)
-            albumlist.extend([x['id'] for x in art_alb['items']])
-    
-    # Pull the tracks for each album one-by-one
+    # Pull the tracks for each album in bulk (from the cache or the API)
     tracklist = []
-    for album in albumlist:
-        # Get album tracks from API
-        alb_trk = sp.album_tracks(album, limit=50)
-        
-        # Put results into a list and go through pagination
-        tracklist.extend([(x['name'], x['id'], x['artists']) for x in alb_trk['items']])
-        while alb_trk['next']:
-            alb_trk = sp.next(alb_trk)
-            tracklist.extend([(x['name'], x['id'], x['artists']) for x in alb_trk['items']])
+    for items in album_track_items(albumlist):
+        tracklist.extend([(x['name'], x['id'], x['artists']) for x in items])
             
     # Extract the artist id's from the tracklist
     collab_list = []
@@ -392,8 +595,15 @@ def get_collabs(artist_id):
 
 def suggested_collabs(input_artist):
     """Return a list of suggested collaborations for a given seed artist."""
-    # Get the related artist network (degree 1)
-    net = related_artists_network(input_artist, 1)
+    # Get the related artist network (degree 1), along with the artist info from the crawl
+    net, net_info = related_artists_network(input_artist, 1, return_info=True)
+
+    # Get the names of the network artists, pulling any missing from the crawl in one bulk request
+    net_names = {art:net_info[art]['name'] for art in net if art in net_info}
+    missing = [art for art in net if art not in net_info]
+    if missing:
+        missing_df = artist_df(missing)
+        net_names.update(zip(missing_df['Artist_ID'], missing_df['Artist_Name']))
     
     # Get the previous collaborators of the input artist
     seed_collabs = get_collabs(input_artist)
@@ -405,8 +615,7 @@ def suggested_collabs(input_artist):
     worked_with = defaultdict(list)
     for art in net:
         # Get the name of the network artist
-        art_df = artist_df(art)
-        art_name = art_df['Artist_Name'][0]
+        art_name = net_names[art]
 
         # Get the previous collaborators for this artist and add it to the overall list
         net_collabs = get_collabs(art)
@@ -0,0 +1,450 @@
+"""Functions used for serving a local stand-in for the Spotify Web API, for offline testing and benchmarking.
+
+The stand-in serves the endpoints used by spotify_tools.py, either from recorded fixtures or from
+a deterministic synthetic catalog, with configurable latency, error rate, and rate limiting.
+"""
+
+
+# Import libraries
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, urlencode
+import spotipy
+from client_tools import *
+
+
+# Size of the synthetic artist catalog
+N_ARTISTS = 5000
+
+# Number of tracks on each type of synthetic album (min, max)
+ALBUM_SIZES = {'album':(8, 16), 'single':(1, 3), 'compilation':(10, 80)}
+
+# Synthetic ids are base-62 like real ones: artist 'ar12', album 'ar12S3' (artist, type code, number),
+# and track 'ar12S3T0' (album, 'T', number)
+TYPE_CODES = {'album':'L', 'single':'S', 'compilation':'C'}
+ALBUM_ID_RE = re.compile(r'^(ar\d+)([LSC])(\d+)$')
+TRACK_ID_RE = re.compile(r'^(ar\d+[LSC]\d+)T(\d+)$')
+
+
+
+def fixture_key(url):
+    """Turn a request URL into the key used to store and look up its recorded response.
+
+    The key is the path after /v1/ (without surrounding slashes) plus the sorted query string.
+    """
+    parts = urlsplit(url)
+    path = parts.path.split('/v1/', 1)[-1].strip('/')
+    query = urlencode(sorted(parse_qsl(parts.query)))
+    return '{}?{}'.format(path, query) if query else path
+
+
+
+def load_fixtures(path):
+    """Load recorded API responses from a JSON fixture file."""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+
+class Recorder:
+    """Captures real API responses into replayable fixtures.
+
+    Attach it to the requests session of a client (see recording_client()), run the functions
+    to record, then save() the fixtures and serve them with start_standin(fixtures=...).
+    """
+    def __init__(self):
+        self.fixtures = {}
+        self._lock = threading.Lock()
+
+    def hook(self, response, *args, **kwargs):
+        """Requests response hook storing every successful API response."""
+        if response.status_code == 200 and '/v1/' in response.url:
+            try:
+                body = response.json()
+            except ValueError:
+                return
+            with self._lock:
+                self.fixtures[fixture_key(response.url)] = body
+
+    def attach(self, session):
+        """Start recording the responses of a requests session."""
+        session.hooks['response'].append(self.hook)
+
+    def save(self, path):
+        """Write the recorded responses to a JSON fixture file."""
+        with self._lock:
+            with open(path, 'w') as f:
+                json.dump(self.fixtures, f)
+
+
+
+def recording_client(recorder):
+    """Build a real Spotify client whose responses are all captured by a Recorder."""
+    client = new_client()
+    recorder.attach(client._session)
+    return client
+
+
+
+def standin_client(server):
+    """Build a Spotify client pointed at a running stand-in server (inject it with set_client())."""
+    client = spotipy.Spotify(auth='standin-token', requests_session=pooled_session())
+    client.prefix = server.url + '/v1/'
+    return client
+
+
+
+def start_standin(port=0, latency=0, jitter=0, error_rate=0, rate_limit=None, retry_after=1,
+                  fixtures=None, seed=0):
+    """Start a stand-in Spotify API server in a background thread and return it.
+
+    port - the local port to listen on (0 picks a free one, see server.url)
+    latency - the time (in seconds) added to every response
+    jitter - the maximum random time (in seconds) added on top of the latency
+    error_rate - the fraction of requests answered with a 503 error
+    rate_limit - the number of requests allowed in any one second before answering 429 (None for no limit)
+    retry_after - the Retry-After value (in seconds) sent with 429 responses
+    fixtures - a dictionary of recorded responses (or a path to a fixture file) to replay
+    seed - the random seed for the errors and jitter (the synthetic catalog doesn't depend on it)
+    """
+    if isinstance(fixtures, str):
+        fixtures = load_fixtures(fixtures)
+    server = StandinServer(('127.0.0.1', port), StandinHandler)
+    server.configure(latency, jitter, error_rate, rate_limit, retry_after, fixtures or {}, seed)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+
+class StandinServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding the stand-in configuration and request counters."""
+    daemon_threads = True
+
+    def configure(self, latency, jitter, error_rate, rate_limit, retry_after, fixtures, seed):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.fixtures = fixtures
+        self.rng = random.Random(seed)
+        self.recent = deque()
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.url = 'http://{}:{}'.format(*self.server_address)
+
+    def admit(self, endpoint):
+        """Count a request and decide how to answer it: 'ok', 'error' or 'rate_limited'."""
+        with self.lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+            now = time.monotonic()
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+
+            # Rate limit on a sliding one-second window
+            if self.rate_limit is not None:
+                while self.recent and now - self.recent[0] >= 1:
+                    self.recent.popleft()
+                if len(self.recent) >= self.rate_limit:
+                    self.counts['429'] = self.counts.get('429', 0) + 1
+                    return 'rate_limited', delay
+                self.recent.append(now)
+
+            # Random server errors
+            if self.rng.random() < self.error_rate:
+                self.counts['503'] = self.counts.get('503', 0) + 1
+                return 'error', delay
+        return 'ok', delay
+
+    def stats(self):
+        """Return a copy of the request counts for each endpoint (plus '429' and '503' responses)."""
+        with self.lock:
+            return dict(self.counts)
+
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    """Request handler answering the Spotify Web API endpoints used by spotify_tools.py."""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        # Keep the console quiet
+        pass
+
+    def send_json(self, status, body, headers={}):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, val in headers.items():
+            self.send_header(key, val)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        path = parts.path.split('/v1/', 1)[-1].strip('/').split('/')
+        query = dict(parse_qsl(parts.query))
+        endpoint = '/'.join([path[0]] + [p for p in path[2:]])
+
+        # Decide whether to answer normally, with an error, or with a rate limit
+        outcome, delay = self.server.admit(endpoint)
+        if delay:
+            time.sleep(delay)
+        if outcome == 'rate_limited':
+            self.send_json(429, {'error':{'status':429, 'message':'API rate limit exceeded'}},
+                           {'Retry-After':str(self.server.retry_after)})
+            return
+        if outcome == 'error':
+            self.send_json(503, {'error':{'status':503, 'message':'Service unavailable'}})
+            return
+
+        # Replay a recorded response if there is one, pointing its paging links at the stand-in
+        key = fixture_key(self.path)
+        if key in self.server.fixtures:
+            body = json.dumps(self.server.fixtures[key]).replace('https://api.spotify.com', self.server.url)
+            self.send_json(200, json.loads(body))
+            return
+
+        # Otherwise answer from the synthetic catalog
+        try:
+            body = synthetic_response(path, query, self.server.url)
+        except (KeyError, ValueError, IndexError):
+            body = None
+        if body is None:
+            self.send_json(404, {'error':{'status':404, 'message':'Not found'}})
+        else:
+            self.send_json(200, body)
+
+
+
+def synthetic_response(path, query, base_url):
+    """Build the response for an API path from the synthetic catalog (None if the endpoint isn't supported).
+
+    path - the list of path segments after /v1/
+    query - dictionary of query parameters
+    base_url - the address of the stand-in (for paging links)
+    """
+    ids = [x for x in query.get('ids', '').split(',') if x]
+    limit = int(query.get('limit', 20))
+    offset = int(query.get('offset', 0))
+
+    if path == ['search']:
+        items = [fake_artist(artist_id_from_index(i)) for i in range(offset, min(offset + limit, N_ARTISTS))]
+        return {'artists':{'items':items, 'limit':limit, 'offset':offset, 'total':N_ARTISTS}}
+    if path == ['artists']:
+        return {'artists':[fake_artist(x) for x in ids]}
+    if path[0] == 'artists' and path[2:] == ['related-artists']:
+        return {'artists':[fake_artist(x) for x in fake_related_ids(path[1])]}
+    if path[0] == 'artists' and path[2:] == ['albums']:
+        types = query.get('album_type', query.get('include_groups', 'album,single,compilation')).split(',')
+        items = [fake_album(x, full=False) for x in fake_album_ids(path[1], types)]
+        url = '{}/v1/artists/{}/albums?{}'.format(base_url, path[1], urlencode({'album_type':','.join(types)}))
+        return fake_page(items, offset, limit, url)
+    if path == ['albums']:
+        return {'albums':[fake_album(x, base_url=base_url) for x in ids]}
+    if path[0] == 'albums' and path[2:] == ['tracks']:
+        items = [fake_track(x, full=False) for x in fake_track_ids(path[1])]
+        return fake_page(items, offset, limit, '{}/v1/albums/{}/tracks'.format(base_url, path[1]))
+    if path == ['tracks']:
+        return {'tracks':[fake_track(x) for x in ids]}
+    if path == ['audio-features']:
+        return {'audio_features':[fake_audio_features(x) for x in ids]}
+    if path == ['recommendations']:
+        seeds = [x for x in query.get('seed_artists', '').split(',') if x]
+        return {'tracks':[fake_track(x) for x in fake_recommendations(seeds, limit, query.get('target_popularity'))]}
+    if path[0] == 'playlists' and len(path) == 2:
+        tracks = fake_recommendations([artist_id_from_index(id_index(path[1]) % N_ARTISTS)], 50, None)
+        items = [{'track':fake_track(x)} for x in tracks]
+        return {'id':path[1], 'name':'Playlist ' + path[1], 'tracks':fake_page(items, 0, 100, '')}
+    return None
+
+
+
+def fake_page(items, offset, limit, url):
+    """Put a slice of items into a paging object, with a link to the next page if there is one."""
+    nxt = None
+    if offset + limit < len(items):
+        sep = '&' if '?' in url else '?'
+        nxt = '{}{}offset={}&limit={}'.format(url, sep, offset + limit, limit)
+    return {'items':items[offset:offset+limit], 'limit':limit, 'offset':offset,
+            'total':len(items), 'next':nxt, 'previous':None}
+
+
+
+def id_index(x):
+    """Deterministic integer for any id string (used to seed the synthetic data)."""
+    return zlib.crc32(x.encode())
+
+
+
+def rng_for(*keys):
+    """Deterministic random generator for a combination of keys."""
+    return random.Random(id_index('|'.join(str(k) for k in keys)))
+
+
+
+def artist_id_from_index(n):
+    """The id of the n-th synthetic artist."""
+    return 'ar{}'.format(n)
+
+
+
+def artist_index(artist_id):
+    """The position of an artist in the synthetic catalog (unknown ids are hashed into it)."""
+    if artist_id.startswith('ar') and artist_id[2:].isdigit():
+        return int(artist_id[2:]) % N_ARTISTS
+    return id_index(artist_id) % N_ARTISTS
+
+
+
+def fake_artist(artist_id):
+    """Synthetic artist object."""
+    rng = rng_for('artist', artist_id)
+    popularity = rng.randint(0, 100)
+    return {'id':artist_id,
+            'name':'Artist {}'.format(artist_id),
+            'genres':['genre {}'.format(artist_index(artist_id) // 100)],
+            'followers':{'total':int(10 ** (popularity / 15) * rng.uniform(0.5, 2))},
+            'popularity':popularity,
+            'images':[],
+            'type':'artist'}
+
+
+
+def fake_related_ids(artist_id):
+    """The 20 related artists of an artist, drawn mostly from its neighborhood in the catalog."""
+    rng = rng_for('related', artist_id)
+    n = artist_index(artist_id)
+    related = []
+    while len(related) < 20:
+        other = artist_id_from_index((n + int(rng.gauss(0, 40))) % N_ARTISTS)
+        if other != artist_id and other not in related:
+            related.append(other)
+    return related
+
+
+
+def fake_album_ids(artist_id, album_types):
+    """The album ids of an artist for the chosen album types, in order."""
+    ids = []
+    for typ in album_types:
+        rng = rng_for('albums', artist_id, typ)
+        if typ == 'appears_on':
+            # Albums of neighboring artists
+            others = fake_related_ids(artist_id)[:rng.randint(0, 5)]
+            ids.extend(['{}{}0'.format(x, TYPE_CODES['album']) for x in others])
+        elif typ in ALBUM_SIZES:
+            count = rng.choice([0, 1, 2, 5, 10, 40, 120]) if typ == 'single' else rng.randint(0, 8)
+            ids.extend(['{}{}{}'.format(artist_id, TYPE_CODES[typ], k) for k in range(count)])
+    return ids
+
+
+
+def split_album_id(album_id):
+    """The artist id and album type of a synthetic album id (raises ValueError for other ids)."""
+    match = ALBUM_ID_RE.match(album_id)
+    if match is None:
+        raise ValueError('Not a stand-in album id: {}'.format(album_id))
+    typ = [t for t, code in TYPE_CODES.items() if code == match.group(2)][0]
+    return match.group(1), typ
+
+
+
+def split_track_id(track_id):
+    """The album id of a synthetic track id (raises ValueError for other ids)."""
+    match = TRACK_ID_RE.match(track_id)
+    if match is None:
+        raise ValueError('Not a stand-in track id: {}'.format(track_id))
+    return match.group(1)
+
+
+
+def fake_track_ids(album_id):
+    """The track ids of an album."""
+    artist_id, typ = split_album_id(album_id)
+    rng = rng_for('tracks', album_id)
+    return ['{}T{}'.format(album_id, k) for k in range(rng.randint(*ALBUM_SIZES[typ]))]
+
+
+
+def fake_album(album_id, full=True, base_url=''):
+    """Synthetic album object (with the first page of tracks when full)."""
+    artist_id, typ = split_album_id(album_id)
+    rng = rng_for('album', album_id)
+    album = {'id':album_id,
+             'name':'Album {}'.format(album_id),
+             'album_type':typ,
+             'artists':[{'id':artist_id, 'name':'Artist {}'.format(artist_id)}],
+             'release_date':'{}-01-01'.format(rng.randint(1960, 2020))}
+    if full:
+        items = [fake_track(x, full=False) for x in fake_track_ids(album_id)]
+        album.update({'genres':[],
+                      'popularity':rng.randint(0, 100),
+                      'label':'Label {}'.format(rng.randint(0, 50)),
+                      'tracks':fake_page(items, 0, 50, '{}/v1/albums/{}/tracks'.format(base_url, album_id))})
+    return album
+
+
+
+def fake_track(track_id, full=True):
+    """Synthetic track object (simplified, without album and popularity, unless full)."""
+    album_id = split_track_id(track_id)
+    artist_id, typ = split_album_id(album_id)
+    rng = rng_for('track', track_id)
+    artists = [{'id':artist_id, 'name':'Artist {}'.format(artist_id)}]
+    # Some tracks feature a related artist
+    if rng.random() < 0.15:
+        other = rng.choice(fake_related_ids(artist_id))
+        artists.append({'id':other, 'name':'Artist {}'.format(other)})
+    track = {'id':track_id,
+             'name':'Track {}'.format(track_id),
+             'artists':artists,
+             'explicit':rng.random() < 0.3,
+             'duration_ms':rng.randint(90000, 400000)}
+    if full:
+        track.update({'album':{'id':album_id, 'name':'Album {}'.format(album_id)},
+                      'popularity':int(min(100, max(0, rng.gauss(fake_artist(artist_id)['popularity'], 15))))})
+    return track
+
+
+
+def fake_audio_features(track_id):
+    """Synthetic audio features of a track (a few tracks don't have any)."""
+    rng = rng_for('features', track_id)
+    if rng.random() < 0.02:
+        return None
+    return {'id':track_id,
+            'key':rng.randint(0, 11),
+            'mode':rng.randint(0, 1),
+            'time_signature':rng.choice([3, 4, 4, 4, 5]),
+            'acousticness':rng.random(),
+            'danceability':rng.random(),
+            'energy':rng.random(),
+            'instrumentalness':rng.random() ** 3,
+            'liveness':rng.random() ** 2,
+            'loudness':-rng.uniform(0, 30),
+            'speechiness':rng.random() ** 2,
+            'valence':rng.random(),
+            'tempo':rng.uniform(60, 200)}
+
+
+
+def fake_recommendations(seed_artists, limit, target_popularity):
+    """Recommended track ids for a list of seed artists, drawn from their neighborhoods in the catalog."""
+    rng = rng_for('recommendations', ','.join(seed_artists), target_popularity)
+    tracks = []
+    for _ in range(limit):
+        seed = rng.choice(seed_artists)
+        artist_id = artist_id_from_index((artist_index(seed) + int(rng.gauss(0, 60))) % N_ARTISTS)
+        albums = fake_album_ids(artist_id, ['album', 'single'])
+        if albums:
+            album_tracks = fake_track_ids(rng.choice(albums))
+            tracks.append(rng.choice(album_tracks))
+    return tracks
@@ -0,0 +1,670 @@
+"""Functions used for storing the artist datasets in a columnar, memory-mapped format.
+
+Layout of a store directory:
+    manifest.json - the numeric column dtypes, the total number of rows, and for each artist its
+                    file number, save name, artist tuple, column order, and (offset, length) of its rows
+    features/<column>.bin - the numeric audio feature columns of every artist, one raw array per column,
+                            which are memory-mapped on load (so reading one artist or all of them is near-zero-copy)
+    side/artist_<#>.json - the artist's network, seed tracklist, and recommendation lists
+    tracks/ - the global track store shared by every artist (see TrackStore), so each track's
+              name, album, and audio features are only stored once however many artists it appears for
+
+Each artist's rows in the feature columns only hold its own popularity snapshot and a reference
+(Track_Row) to the track's row in the track store.
+"""
+
+
+# Import libraries
+import os
+import json
+import time
+import pickle
+import shutil
+import threading
+import contextlib
+import numpy as np
+import pandas as pd
+try:
+    import fcntl
+except ImportError:
+    # File locks are only available on POSIX systems (elsewhere only threads are kept apart)
+    fcntl = None
+
+
+# Default location of the dataset store
+STORE_DIR = 'Data/store'
+
+# The numeric columns of the track dataframe, and the dtype each is stored as
+NUMERIC_COLS = {'Track_Popularity':'int64',
+                'Track_Explicitness':'int64',
+                'Track_Duration':'int64',
+                'Track_Key':'int64',
+                'Track_Mode':'int64',
+                'Track_TimeSig':'int64',
+                'Track_Acousticness':'float64',
+                'Track_Danceability':'float64',
+                'Track_Energy':'float64',
+                'Track_Instrumentalness':'float64',
+                'Track_Liveness':'float64',
+                'Track_Loudness':'float64',
+                'Track_Speechiness':'float64',
+                'Track_Valence':'float64',
+                'Track_Tempo':'float64'}
+
+# The columns stored for each artist (the rest are looked up in the track store through Track_Row)
+ARTIST_COLS = {'Track_Popularity':'int64',
+               'Track_Row':'int64'}
+
+# The string and list columns of the track dataframe kept in the track store
+# (the original datasets had a single Track_Album column holding the album id)
+TRACK_SIDE_COLS = ['Track_Name', 'Track_Artists', 'Track_Album_Name', 'Track_Album_ID']
+LEGACY_COLS = {'Track_Album':'Track_Album_ID'}
+
+# Columns of a track dataframe, in order
+TRACK_COLS = ['Track_Name', 'Track_ID', 'Track_Artists', 'Track_Album_Name', 'Track_Album_ID'] + list(NUMERIC_COLS)
+
+# How long (in seconds) a popularity score in the track store is used before it is refreshed
+POPULARITY_TTL = 7 * 24 * 60 * 60
+
+# The process-wide track store, opened on first use or replaced with set_track_store()
+_track_store = None
+_track_store_enabled = True
+_track_store_lock = threading.Lock()
+_track_stores = {}
+
+
+
+@contextlib.contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on a lock file while running a block, so only one process (or thread) at a time runs it.
+
+    The lock isn't reentrant, so a block must not take the same lock again.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+
+def store_lock_path(store_dir, name='store'):
+    """Return the path of a store's lock file (kept next to the store, so it outlives compact_store() swapping the folder)."""
+    return '{}.{}.lock'.format(os.path.abspath(store_dir).rstrip('/'), name)
+
+
+
+def atomic_write_json(obj, path):
+    """Write an object as JSON by writing a temporary file and renaming it over the target."""
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, 'w') as f:
+        json.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+
+def atomic_write_pickle(obj, path):
+    """Pickle an object by writing a temporary file and renaming it over the target."""
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+
+def load_manifest(store_dir=STORE_DIR):
+    """Load the manifest of a store (an empty one if the store doesn't exist yet)."""
+    fpath = os.path.join(store_dir, 'manifest.json')
+    if not os.path.exists(fpath):
+        return {'columns':dict(ARTIST_COLS), 'n_rows':0, 'artists':{}}
+    with open(fpath, 'r') as f:
+        return json.load(f)
+
+
+
+class TrackStore:
+    """Global store of track rows keyed by Track_ID, shared by every artist's dataset.
+
+    Layout of the track store folder:
+        manifest.json - the number of rows, and the number of bytes of the side table they cover
+        <column>.bin - the numeric columns, plus when each popularity score was pulled (Track_Fetched),
+                       one raw array per column which is memory-mapped on read
+        side.jsonl - one line per row with the track's id, name, artists, album name, and album id
+
+    Writes are guarded by a lock file next to the store (see file_lock()), so several processes
+    can share a track store: each one re-reads the manifest under the lock and appends after the
+    rows written by the others. Rows are only ever appended: when a track is stored again (to fill in columns the original
+    datasets didn't have, or because its audio features changed) its id points to the new row,
+    and datasets referencing the old row keep it.
+
+    store_dir - the location of the dataset store (the track store is its tracks/ folder)
+    popularity_ttl - the age (in seconds) beyond which stored popularity scores are refreshed
+    """
+    def __init__(self, store_dir=STORE_DIR, popularity_ttl=POPULARITY_TTL):
+        self.store_dir = store_dir
+        self.path = os.path.join(store_dir, 'tracks')
+        self.popularity_ttl = popularity_ttl
+        self.columns = dict(NUMERIC_COLS, Track_Fetched='float64')
+        self.manifest = {'n_rows':0, 'side_bytes':0}
+        self.ids = []
+        self.side = []
+        self.index = {}
+        self._lock = threading.Lock()
+        with self._lock:
+            self._refresh()
+
+    def __len__(self):
+        return self.manifest['n_rows']
+
+    def _refresh(self):
+        """Read any rows added to the store (e.g. by another process) since it was last read (lock must be held)."""
+        fpath = os.path.join(self.path, 'manifest.json')
+        if not os.path.exists(fpath):
+            return
+        with open(fpath, 'r') as f:
+            manifest = json.load(f)
+        # Start over if the store was rewritten (by compact_store()) since it was last read
+        if manifest.get('generation') != self.manifest.get('generation'):
+            self._reload(manifest)
+            return
+        if manifest['n_rows'] == self.manifest['n_rows']:
+            return
+
+        # Only read the side table up to the end recorded in the manifest
+        with open(os.path.join(self.path, 'side.jsonl'), 'rb') as f:
+            f.seek(self.manifest['side_bytes'])
+            lines = f.read(manifest['side_bytes'] - self.manifest['side_bytes']).splitlines()
+        for line in lines:
+            vals = json.loads(line)
+            self.index[vals[0]] = len(self.ids)
+            self.ids.append(vals[0])
+            self.side.append(vals[1:])
+        self.manifest = manifest
+
+    def _reload(self, manifest=None):
+        """Forget the rows read so far and read the store again from the start (lock must be held)."""
+        self.manifest = {'n_rows':0, 'side_bytes':0}
+        if manifest is not None:
+            self.manifest['generation'] = manifest.get('generation')
+        self.ids = []
+        self.side = []
+        self.index = {}
+        self._refresh()
+
+    def _column(self, col, mode='r'):
+        """Memory-map one of the numeric columns."""
+        fpath = os.path.join(self.path, '{}.bin'.format(col))
+        return np.memmap(fpath, dtype=self.columns[col], mode=mode, shape=(self.manifest['n_rows'],))
+
+    def lookup(self, track_ids):
+        """Return a dictionary of the row of each stored track (tracks missing any columns are left out)."""
+        with self._lock:
+            self._refresh()
+            found = {}
+            for x in track_ids:
+                row = self.index.get(x)
+                if row is not None and None not in self.side[row]:
+                    found[x] = row
+            return found
+
+    def stale(self, rows):
+        """Return a boolean array marking the rows whose popularity scores are older than popularity_ttl."""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return np.zeros(0, dtype=bool)
+        return self._column('Track_Fetched')[rows] < time.time() - self.popularity_ttl
+
+    def add(self, df, fetched=None):
+        """Add the tracks of a track dataframe that aren't in the store yet.
+
+        df - a dataframe in the track_df() format (or the original format, with a Track_Album column)
+        fetched - when the popularity scores were pulled (now by default; 0 marks them to be refreshed)
+        Returns an array of the row of each track in the dataframe.
+        """
+        fetched = time.time() if fetched is None else fetched
+        df = df.rename(columns=LEGACY_COLS)
+        ids = list(df['Track_ID'])
+        complete = all(col in df.columns for col in TRACK_SIDE_COLS)
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock, file_lock(store_lock_path(self.store_dir, 'tracks')):
+            self._refresh()
+
+            # Find the new tracks (and stored ones the dataframe can fill in missing columns for)
+            new = []
+            stored = []
+            seen = set()
+            for i, x in enumerate(ids):
+                if x in seen:
+                    continue
+                seen.add(x)
+                row = self.index.get(x)
+                if row is None or (complete and None in self.side[row]):
+                    new.append(i)
+                else:
+                    stored.append(i)
+
+            # Audio features are occasionally re-analyzed, so tracks whose features differ
+            # from the stored ones are stored again (keeping the datasets exactly as they were)
+            if stored and self.manifest['n_rows']:
+                rows = np.array([self.index[ids[i]] for i in stored], dtype=np.int64)
+                changed = np.zeros(len(stored), dtype=bool)
+                for col in NUMERIC_COLS:
+                    if col == 'Track_Popularity':
+                        continue
+                    old = self._column(col)[rows]
+                    vals = df[col].values[stored].astype(old.dtype)
+                    same = old == vals
+                    if old.dtype.kind == 'f':
+                        same |= np.isnan(old) & np.isnan(vals)
+                    changed |= ~same
+                new = sorted(new + [i for i, c in zip(stored, changed) if c])
+
+            if new:
+                # Append the numeric columns (starting where the manifest ends, in case a
+                # previous write was interrupted before the manifest was updated)
+                offset = self.manifest['n_rows']
+                for col, dtype in self.columns.items():
+                    if col == 'Track_Fetched':
+                        vals = np.full(len(new), fetched, dtype=dtype)
+                    else:
+                        vals = np.ascontiguousarray(df[col].values[new], dtype=dtype)
+                    itemsize = np.dtype(dtype).itemsize
+                    fpath = os.path.join(self.path, '{}.bin'.format(col))
+                    with open(fpath, 'r+b' if os.path.exists(fpath) else 'wb') as f:
+                        f.truncate(offset * itemsize)
+                        f.seek(offset * itemsize)
+                        f.write(vals.tobytes())
+
+                # Append the string and list columns to the side table
+                obj_cols = [list(df[col]) if col in df.columns else [None] * len(df) for col in TRACK_SIDE_COLS]
+                lines = []
+                for i in new:
+                    row_vals = [ids[i]] + [c[i] for c in obj_cols]
+                    lines.append(json.dumps(row_vals, default=list).encode() + b'\n')
+                    self.index[ids[i]] = len(self.ids)
+                    self.ids.append(ids[i])
+                    self.side.append(row_vals[1:])
+                side_bytes = self.manifest['side_bytes']
+                fpath = os.path.join(self.path, 'side.jsonl')
+                with open(fpath, 'r+b' if os.path.exists(fpath) else 'wb') as f:
+                    f.truncate(side_bytes)
+                    f.seek(side_bytes)
+                    f.write(b''.join(lines))
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                # Record the new rows in the manifest last
+                self.manifest = dict(self.manifest,
+                                     n_rows=offset + len(new),
+                                     side_bytes=side_bytes + sum(len(x) for x in lines))
+                atomic_write_json(self.manifest, os.path.join(self.path, 'manifest.json'))
+
+            return np.array([self.index[x] for x in ids], dtype=np.int64)
+
+    def set_popularity(self, popularity, fetched=None):
+        """Update the popularity scores of stored tracks.
+
+        popularity - a dictionary of popularity scores keyed by track id
+        fetched - when the scores were pulled (now by default)
+        """
+        fetched = time.time() if fetched is None else fetched
+        with self._lock, file_lock(store_lock_path(self.store_dir, 'tracks')):
+            self._refresh()
+            known = [x for x in popularity if x in self.index]
+            if not known:
+                return
+            rows = np.array([self.index[x] for x in known], dtype=np.int64)
+            pop = self._column('Track_Popularity', 'r+')
+            pop[rows] = [popularity[x] for x in known]
+            pop.flush()
+            times = self._column('Track_Fetched', 'r+')
+            times[rows] = fetched
+            times.flush()
+
+    def arrays(self, rows, columns=None):
+        """Return a dictionary of the numeric columns (all of them by default) for a list of rows."""
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = list(self.columns) if columns is None else columns
+        if not self.manifest['n_rows']:
+            return {col:np.zeros(0, dtype=self.columns[col]) for col in columns}
+        return {col:self._column(col)[rows] for col in columns}
+
+    def object_columns(self, rows, columns=TRACK_SIDE_COLS):
+        """Return a dictionary of the string and list columns (or Track_ID) for a list of rows."""
+        pos = {col:n for n, col in enumerate(TRACK_SIDE_COLS)}
+        cols = {}
+        for col in columns:
+            if col == 'Track_ID':
+                cols[col] = [self.ids[r] for r in rows]
+            else:
+                n = pos[LEGACY_COLS.get(col, col)]
+                cols[col] = [self.side[r][n] for r in rows]
+        return cols
+
+    def frame(self, rows):
+        """Build a dataframe in the track_df() format from a list of rows."""
+        cols = self.object_columns(rows, TRACK_COLS[:5])
+        cols.update(self.arrays(rows, list(NUMERIC_COLS)))
+        return pd.DataFrame(cols, columns=TRACK_COLS)
+
+
+
+def open_track_store(store_dir=STORE_DIR):
+    """Return the track store of a dataset store, opening it on first use (it's shared by every caller)."""
+    key = os.path.abspath(store_dir)
+    with _track_store_lock:
+        if key not in _track_stores:
+            _track_stores[key] = TrackStore(store_dir)
+        return _track_stores[key]
+
+
+
+def get_track_store():
+    """Return the track store consulted by track_df(), opening it on first use (None if turned off)."""
+    if not _track_store_enabled:
+        return None
+    if _track_store is not None:
+        return _track_store
+    return open_track_store()
+
+
+
+def set_track_store(store):
+    """Replace the track store consulted by track_df().
+
+    store - a TrackStore object, or None to turn it off
+    """
+    global _track_store, _track_store_enabled
+    with _track_store_lock:
+        _track_store = store
+        _track_store_enabled = store is not None
+        if store is not None:
+            _track_stores[os.path.abspath(store.store_dir)] = store
+
+
+
+def store_filerange(store_dir=STORE_DIR):
+    """Return the sorted file numbers of the artists in a store."""
+    manifest = load_manifest(store_dir)
+    return sorted(int(x) for x in manifest['artists'])
+
+
+
+def append_artist(i_file, data, store_dir=STORE_DIR):
+    """Add (or replace) an artist's dataset in the store.
+
+    The artist's tracks are added to the track store (if they aren't there already), and only
+    references to them are kept with the artist, along with its own popularity scores.
+    Replacing an artist leaves its old rows unreferenced in the column files until compact_store() is run.
+
+    Writes are guarded by a lock file next to the store, so several processes can add artists to the same store.
+
+    i_file - the file number of the artist (its index in random_artists)
+    data - the artist's data in the save_random_artist_data() format: [save_name, artist, seed_data]
+    store_dir - the location of the store
+    """
+    os.makedirs(os.path.join(store_dir, 'features'), exist_ok=True)
+    os.makedirs(os.path.join(store_dir, 'side'), exist_ok=True)
+    # Only one process at a time reads the manifest, appends its rows, and writes the manifest back
+    with file_lock(store_lock_path(store_dir)):
+        _append_artist(i_file, data, store_dir)
+
+
+
+def _append_artist(i_file, data, store_dir):
+    """Add an artist's dataset to the store (the store's lock must be held)."""
+    save_name, artist, seed_data = data
+    artist_id, net, seed_list, recs, recs_filt, df = seed_data[:6]
+    member_recs = seed_data[6] if len(seed_data) > 6 else None
+    manifest = load_manifest(store_dir)
+    offset = manifest['n_rows']
+    referenced = 'Track_Row' in manifest['columns']
+
+    # Add the tracks to the track store (their popularity scores are marked to be refreshed,
+    # as it isn't known when they were pulled), and look up the artist's columns
+    length = 0 if df is None else len(df)
+    cols = {}
+    if length:
+        for col in manifest['columns']:
+            if col == 'Track_Row':
+                cols[col] = open_track_store(store_dir).add(df, fetched=0)
+            else:
+                cols[col] = df[col].values
+
+    # Append the artist's columns to the column files (starting where the manifest ends,
+    # in case a previous write was interrupted before the manifest was updated)
+    for col, dtype in manifest['columns'].items():
+        itemsize = np.dtype(dtype).itemsize
+        fpath = os.path.join(store_dir, 'features', '{}.bin'.format(col))
+        with open(fpath, 'r+b' if os.path.exists(fpath) else 'wb') as f:
+            f.truncate(offset * itemsize)
+            f.seek(offset * itemsize)
+            if length:
+                f.write(np.ascontiguousarray(cols[col], dtype=dtype).tobytes())
+
+    # Write the artist's lists to its side table, plus any string and list columns that aren't in the track store
+    side = {'net':net, 'seed_list':seed_list, 'recs':recs, 'recs_filt':recs_filt, 'member_recs':member_recs, 'columns':{}}
+    if df is not None:
+        for col in df.columns:
+            if col in manifest['columns'] or (referenced and (col in TRACK_COLS or col in LEGACY_COLS)):
+                continue
+            side['columns'][col] = list(df[col])
+    atomic_write_json(side, os.path.join(store_dir, 'side', 'artist_{}.json'.format(i_file)))
+
+    # Record the artist's rows in the manifest last, so a crash never leaves a partial entry
+    manifest['artists'][str(i_file)] = {'save_name':save_name,
+                                        'artist':list(artist),
+                                        'artist_id':artist_id,
+                                        'has_df':df is not None,
+                                        'col_order':[] if df is None else list(df.columns),
+                                        'offset':offset,
+                                        'length':length}
+    manifest['n_rows'] = offset + length
+    atomic_write_json(manifest, os.path.join(store_dir, 'manifest.json'))
+
+
+
+def compact_store(store_dir=STORE_DIR):
+    """Rewrite a store with only the rows that are still in use.
+
+    Replacing an artist (e.g. with save_random_artist_data(..., incremental=True)) leaves its old
+    rows behind in the feature columns, and tracks stored again after their audio features changed
+    leave their old rows in the track store. The compacted store keeps every artist's current rows,
+    and every track row that an artist references or that is the latest row for its track id.
+    It is built in a new folder next to the store (<store_dir>.compact), which is then swapped in.
+
+    store_dir - the location of the store
+    Returns the number of artist rows and the number of track rows dropped.
+    """
+    store_dir = store_dir.rstrip('/')
+    with file_lock(store_lock_path(store_dir)):
+        return _compact_store(store_dir)
+
+
+
+def _compact_store(store_dir):
+    """Rewrite a store with only the rows that are still in use (the store's lock must be held)."""
+    manifest = load_manifest(store_dir)
+    new_dir = store_dir + '.compact'
+    if os.path.exists(new_dir):
+        shutil.rmtree(new_dir)
+    os.makedirs(os.path.join(new_dir, 'features'))
+
+    # Gather each artist's current rows, in the order they were stored
+    entries = sorted(manifest['artists'].values(), key=lambda e: e['offset'])
+    arrays = artist_arrays(None, store_dir, manifest)
+    cols = {col:np.concatenate([arr[e['offset']:e['offset'] + e['length']] for e in entries] or [arr[:0]])
+            for col, arr in arrays.items()}
+    offset = 0
+    for e in entries:
+        e['offset'] = offset
+        offset += e['length']
+
+    # Keep the track rows that are referenced or current, and point the artists' references at their new rows
+    tracks = open_track_store(store_dir)
+    with tracks._lock, file_lock(store_lock_path(store_dir, 'tracks')):
+        tracks._refresh()
+        dropped_tracks = 0
+        if 'Track_Row' in cols and len(tracks):
+            keep = np.zeros(len(tracks), dtype=bool)
+            keep[cols['Track_Row']] = True
+            keep[list(tracks.index.values())] = True
+            rows = np.flatnonzero(keep)
+            remap = np.full(len(tracks), -1, dtype=np.int64)
+            remap[rows] = np.arange(len(rows))
+            cols['Track_Row'] = remap[cols['Track_Row']]
+            dropped_tracks = len(tracks) - len(rows)
+
+            os.makedirs(os.path.join(new_dir, 'tracks'))
+            for col in tracks.columns:
+                tracks._column(col)[rows].tofile(os.path.join(new_dir, 'tracks', '{}.bin'.format(col)))
+            lines = [json.dumps([tracks.ids[r]] + tracks.side[r], default=list).encode() + b'\n' for r in rows]
+            with open(os.path.join(new_dir, 'tracks', 'side.jsonl'), 'wb') as f:
+                f.write(b''.join(lines))
+            # A new generation tells other processes to read the track store again from the start
+            atomic_write_json({'n_rows':len(rows),
+                               'side_bytes':sum(len(x) for x in lines),
+                               'generation':time.time()}, os.path.join(new_dir, 'tracks', 'manifest.json'))
+
+        # Write the artists' columns, and copy everything else (side tables, journals, ...) as it is
+        for col, dtype in manifest['columns'].items():
+            np.ascontiguousarray(cols[col], dtype=dtype).tofile(os.path.join(new_dir, 'features', '{}.bin'.format(col)))
+        for name in os.listdir(store_dir):
+            if name in os.listdir(new_dir):
+                continue
+            src = os.path.join(store_dir, name)
+            if os.path.isdir(src):
+                shutil.copytree(src, os.path.join(new_dir, name))
+            else:
+                shutil.copy2(src, os.path.join(new_dir, name))
+        dropped_rows = manifest['n_rows'] - offset
+        manifest['n_rows'] = offset
+        atomic_write_json(manifest, os.path.join(new_dir, 'manifest.json'))
+
+        # Swap the compacted store in (the old one is kept as <store_dir>.old until it's in place)
+        old_dir = store_dir + '.old'
+        if os.path.exists(old_dir):
+            shutil.rmtree(old_dir)
+        os.replace(store_dir, old_dir)
+        os.replace(new_dir, store_dir)
+        shutil.rmtree(old_dir)
+        tracks._reload()
+    return dropped_rows, dropped_tracks
+
+
+
+def artist_arrays(i_file=None, store_dir=STORE_DIR, manifest=None):
+    """Memory-map the columns stored with the artists (the popularity scores and track store references).
+
+    i_file - the file number of one artist (returns views of just its rows), or None for every row
+    store_dir - the location of the store
+    manifest - an already loaded manifest (optional)
+    Returns a dictionary of read-only arrays keyed by column name.
+    """
+    if manifest is None:
+        manifest = load_manifest(store_dir)
+    if i_file is None:
+        start, stop = 0, manifest['n_rows']
+    else:
+        entry = manifest['artists'][str(i_file)]
+        start, stop = entry['offset'], entry['offset'] + entry['length']
+
+    arrays = {}
+    for col, dtype in manifest['columns'].items():
+        if manifest['n_rows'] == 0:
+            arrays[col] = np.zeros(0, dtype=dtype)
+            continue
+        fpath = os.path.join(store_dir, 'features', '{}.bin'.format(col))
+        mm = np.memmap(fpath, dtype=dtype, mode='r', shape=(manifest['n_rows'],))
+        arrays[col] = mm[start:stop]
+    return arrays
+
+
+
+def load_feature_arrays(i_file=None, store_dir=STORE_DIR, manifest=None):
+    """Load the numeric columns of the store, without unpickling or building any dataframes.
+
+    The popularity scores are memory-mapped views of the artists' rows, and the audio features
+    are gathered from the memory-mapped track store columns.
+
+    i_file - the file number of one artist, or None for every row
+    store_dir - the location of the store
+    manifest - an already loaded manifest (optional)
+    Returns a dictionary of arrays keyed by column name.
+    """
+    arrays = artist_arrays(i_file, store_dir, manifest)
+    if 'Track_Row' in arrays:
+        rows = arrays.pop('Track_Row')
+        missing = [col for col in NUMERIC_COLS if col not in arrays]
+        arrays.update(open_track_store(store_dir).arrays(rows, missing))
+    return {col:arrays[col] for col in NUMERIC_COLS}
+
+
+
+def artist_offsets(store_dir=STORE_DIR):
+    """Return a dictionary of (offset, length) row ranges for each artist's file number."""
+    manifest = load_manifest(store_dir)
+    return {int(k):(v['offset'], v['length']) for k, v in manifest['artists'].items()}
+
+
+
+def load_artist_data(i_file, store_dir=STORE_DIR, manifest=None):
+    """Load an artist's dataset from the store, in the save_random_artist_data() format.
+
+    Returns [save_name, artist, (artist_id, net, seed_list, recs, recs_filt, df, member_recs)], or None
+    if the artist isn't in the store (member_recs is None for datasets saved without each artist's recommendations).
+    """
+    if manifest is None:
+        manifest = load_manifest(store_dir)
+    entry = manifest['artists'].get(str(i_file))
+    if entry is None:
+        return None
+
+    # Read the side table
+    with open(os.path.join(store_dir, 'side', 'artist_{}.json'.format(i_file)), 'r') as f:
+        side = json.load(f)
+
+    # Rebuild the track dataframe from the artist's columns, the track store, and the side table
+    df = None
+    if entry['has_df']:
+        arrays = dict(artist_arrays(i_file, store_dir, manifest))
+        if 'Track_Row' in arrays:
+            rows = arrays.pop('Track_Row')
+            tracks = open_track_store(store_dir)
+            arrays.update(tracks.arrays(rows, [col for col in NUMERIC_COLS if col not in arrays]))
+            obj_cols = [col for col in entry['col_order'] if col not in arrays and col not in side['columns']]
+            side['columns'].update(tracks.object_columns(rows, obj_cols))
+        cols = {}
+        for col in entry['col_order']:
+            if col in arrays:
+                cols[col] = arrays[col]
+            else:
+                cols[col] = side['columns'][col]
+        df = pd.DataFrame(cols, columns=entry['col_order'])
+
+    artist = tuple(entry['artist'])
+    seed_data = (entry['artist_id'], side['net'], side['seed_list'], side['recs'], side['recs_filt'], df,
+                 side.get('member_recs'))
+    return [entry['save_name'], artist, seed_data]
+
+
+
+def build_dataset_store(filerange=range(201), store_dir=STORE_DIR, data_dir='Data'):
+    """Convert the per-artist pickle files (data_artist_#.pkl) into a store."""
+    for i_file in filerange:
+        fpath = os.path.join(data_dir, 'data_artist_{}.pkl'.format(i_file))
+        if not os.path.exists(fpath):
+            continue
+        with open(fpath, 'rb') as f:
+            data = pickle.load(f)
+        append_artist(i_file, data, store_dir)
+        print('Stored: ', data[0])
@@ -0,0 +1,56 @@
+"""Shared setup for the tests: import the modules from the repository root without real credentials."""
+
+
+# Import libraries
+import os
+import sys
+import types
+import pytest
+
+
+# Make the repository's modules importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# client_tools.py imports the API credentials from spotify_credentials.py, which isn't checked in
+if 'spotify_credentials' not in sys.modules:
+    try:
+        import spotify_credentials
+    except ImportError:
+        credentials = types.ModuleType('spotify_credentials')
+        credentials.client_id = 'test-client-id'
+        credentials.client_secret = 'test-client-secret'
+        sys.modules['spotify_credentials'] = credentials
+
+import cache_tools
+import client_tools
+import graph_tools
+import store_tools
+from standin_tools import start_standin, standin_client
+
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run a test from an empty folder, so the default stores under Data/ aren't touched."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+
+@pytest.fixture
+def standin(workdir, monkeypatch):
+    """Point every API function at a stand-in server, with an unthrottled scheduler and empty stores.
+
+    Yields the server, whose stats() count the requests made to each endpoint.
+    """
+    server = start_standin()
+    store = store_tools.TrackStore('store')
+    monkeypatch.setattr(client_tools, '_client', standin_client(server))
+    monkeypatch.setattr(client_tools, '_scheduler', client_tools.RequestScheduler(rate=10000, burst=10000))
+    monkeypatch.setattr(cache_tools, '_cache', cache_tools.ResponseCache('api_cache.sqlite'))
+    monkeypatch.setattr(graph_tools, '_graph', graph_tools.ArtistGraph('artist_graph.npz'))
+    monkeypatch.setattr(store_tools, '_track_store', store)
+    monkeypatch.setitem(store_tools._track_stores, os.path.abspath('store'), store)
+    yield server
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,55 @@
+"""Tests for the persistent artist graph."""
+
+
+# Import libraries
+import os
+import random
+from graph_tools import ArtistGraph
+
+
+
+def random_related(rng, artist_ids, n_related=5):
+    """Related artist payloads for a list of artists, drawn at random from 200 artists."""
+    return {x:[{'id':'ar{}'.format(rng.randrange(200))} for _ in range(n_related)] for x in artist_ids}
+
+
+
+def test_save_round_trip(workdir):
+    rng = random.Random(0)
+    graph = ArtistGraph('artist_graph.npz')
+    expected = {}
+    for step in range(5):
+        related = random_related(rng, ['ar{}'.format(rng.randrange(200)) for _ in range(30)], n_related=step+1)
+        graph.update(related)
+        expected.update({x:[a['id'] for a in arts] for x, arts in related.items()})
+        graph.save()
+
+    loaded = ArtistGraph('artist_graph.npz')
+    assert len(loaded) == len(graph)
+    for x, related_ids in expected.items():
+        assert loaded.related(x) == related_ids
+
+
+
+def test_save_skips_unchanged_graph(workdir):
+    graph = ArtistGraph('artist_graph.npz')
+    graph.update(random_related(random.Random(0), ['ar1', 'ar2']))
+    graph.save()
+    stamp = os.stat('artist_graph.npz').st_mtime_ns
+    graph.save()
+    ArtistGraph('artist_graph.npz').save()
+    assert os.stat('artist_graph.npz').st_mtime_ns == stamp
+
+
+
+def test_save_merges_other_saves(workdir):
+    first = ArtistGraph('artist_graph.npz')
+    second = ArtistGraph('artist_graph.npz')
+    first.update({'ar1':[{'id':'ar2'}]})
+    second.update({'ar3':[{'id':'ar4'}]})
+    first.save()
+    second.save()
+
+    loaded = ArtistGraph('artist_graph.npz')
+    assert loaded.related('ar1') == ['ar2']
+    assert loaded.related('ar3') == ['ar4']
@@ -0,0 +1,43 @@
+"""Tests for pulling and refreshing the seed artist datasets."""
+
+
+# Import libraries
+from model_tools import seed_data, update_seed_data
+
+
+
+def request_count(server):
+    """The number of requests answered by the stand-in (not counting the 429 and 503 tallies)."""
+    return sum(n for endpoint, n in server.stats().items() if endpoint not in ('429', '503'))
+
+
+
+def test_update_seed_data_costs_less_than_a_full_pull(standin):
+    full = seed_data('ar7', 2)
+    artist_id, net, seed_list, recs, recs_filt, df, member_recs = full
+    full_requests = request_count(standin)
+
+    # Pretend one member joined the network since the snapshot and another one left it
+    joined = net[0]
+    previous_recs = {x:tracks for x, tracks in member_recs.items() if x != joined}
+    previous_recs['ar_departed'] = ['departed_track']
+    previous = (artist_id, net[1:], seed_list, recs, recs_filt, df, previous_recs)
+
+    before = standin.stats()
+    update = update_seed_data(previous, 2)
+    after = standin.stats()
+    update_requests = request_count(standin) - full_requests
+
+    # The fresh network isn't crawled again, and only the joined member's recommendations are requested
+    # (once per target popularity), so the update is mostly the known tracks' popularity scores
+    assert after['artists/related-artists'] == before['artists/related-artists']
+    assert after['recommendations'] - before['recommendations'] == 4
+    assert update_requests < full_requests / 3
+    assert 'ar_departed' not in update[6]
+    assert 'departed_track' not in update[3]
+
+    # The update matches the full pull
+    assert set(update[1]) == set(net)
+    assert set(update[3]) == set(recs)
+    assert set(update[4]) == set(recs_filt)
+    assert set(update[5]['Track_ID']) == set(df['Track_ID'])
@@ -0,0 +1,41 @@
+"""Tests for the model registry's fingerprints and caching."""
+
+
+# Import libraries
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from spotify_tools import TRACK_OBJECT_COLS, TRACK_INT_COLS, TRACK_FEATURE_COLS
+import registry_tools
+from registry_tools import ModelRegistry, fingerprint
+from model_tools import prep_data_streamlit, fit_streamlit_model
+
+
+
+def fake_track_frame(n, seed):
+    """Track dataframe with the columns of track_df() and random values."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({col:['{}_{}_{}'.format(col, seed, k) for k in range(n)] for col in TRACK_OBJECT_COLS})
+    for col in TRACK_INT_COLS:
+        df[col] = rng.integers(0, 100, n)
+    for col in TRACK_FEATURE_COLS.values():
+        df[col] = rng.random(n)
+    return df
+
+
+
+def test_fingerprint_ignores_recommendation_order(workdir, monkeypatch):
+    artist_library_df = fake_track_frame(20, 0)
+    reclist_df = fake_track_frame(200, 1)
+    shuffled_df = reclist_df.sample(frac=1, random_state=2)
+    model = RandomForestClassifier(n_estimators=5, random_state=0)
+
+    X_train, y_train, X_test, y_test = prep_data_streamlit(artist_library_df, reclist_df)
+    X_shuffled, y_shuffled, _, _ = prep_data_streamlit(artist_library_df, shuffled_df)
+    assert fingerprint(X_train, y_train, model) == fingerprint(X_shuffled, y_shuffled, model)
+
+    registry = ModelRegistry(str(workdir / 'registry'))
+    monkeypatch.setattr(registry_tools, '_registry', registry)
+    fit_streamlit_model(X_train, y_train, model)
+    fit_streamlit_model(X_shuffled, y_shuffled, model)
+    assert registry.stats() == {'hits':1, 'misses':1}